@@ -2,7 +2,6 @@ import os
 
 from dotenv import load_dotenv, find_dotenv
 from flask import Flask
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 
@@ -28,15 +27,18 @@ create_upload_dir(app.config['UPLOAD_DIR'])
 # Initialize Flask Sql Alchemy
 db = SQLAlchemy(app)
 
-# Initialize Bcrypt
-bcrypt = Bcrypt(app)
-
 # Initialize Mail
 mail = Mail(app)
 
+# Instrument SQL statements
+from app import sql_stats
+
 # Import the application views
 from app import views
 
+# Register CLI commands
+from app import commands
+
 # Register API Endpoints
 from app.api.views import api
 from app.api.post.views import api_post
@@ -50,6 +52,7 @@ from app.api.auth.restore.views import api_restore_password
 from app.api.image.views import api_image
 from app.api.profile.views import api_profile
 from app.api.statistics.views import api_statistics
+from app.tg.views import telegram
 
 app.register_blueprint(api)
 app.register_blueprint(api_post)
@@ -63,3 +66,4 @@ app.register_blueprint(api_restore_password)
 app.register_blueprint(api_image)
 app.register_blueprint(api_profile)
 app.register_blueprint(api_statistics)
+app.register_blueprint(telegram)
@@ -0,0 +1,124 @@
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+from app import app, db
+from app.models import CaptchaCode
+
+
+class DatabaseBackend:
+    """
+    Captchas stored in `captcha_codes`, the secret is the row's random `secret_code`
+    """
+
+    def issue(self, code, image):
+        captcha = CaptchaCode(code=code, image=image)
+        secret = captcha.secret_code
+        captcha.save()
+        return secret
+
+    def verify(self, code, secret):
+        captcha = CaptchaCode.get_by_secret_code(secret)
+        return captcha is not None and captcha.is_valid_code(code)
+
+    def sweep(self):
+        deleted = CaptchaCode.delete_outdated_captchas(app.config['CAPTCHA']['ttl'])
+        db.session.commit()
+        return deleted
+
+
+class ReplaySet:
+    """
+    Keys seen within the last `ttl` seconds. All keys share the same TTL, so the oldest ones are always first
+    and expired keys are evicted from the front on every insert.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._expires = OrderedDict()
+
+    def add(self, key, ttl):
+        """
+        Remembers the key, returns False if it has already been seen
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict(now)
+            if key in self._expires:
+                return False
+            self._expires[key] = now + ttl
+            return True
+
+    def evict(self):
+        with self._lock:
+            return self._evict(time.monotonic())
+
+    def _evict(self, now):
+        evicted = 0
+        while self._expires:
+            key, expires = next(iter(self._expires.items()))
+            if expires > now:
+                break
+            del self._expires[key]
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class SignedBackend:
+    """
+    Database-free captchas: the secret is a signed, expiring token of a random nonce & keyed hash of the code.
+
+    A solved token is remembered in memory until it expires and can't be used once more. The replay set is
+    per worker process, so with several workers a token could be reused once per worker at most.
+    """
+
+    def __init__(self):
+        self.used = ReplaySet()
+
+    def issue(self, code, image):
+        nonce = secrets.token_urlsafe(12)
+        return self._serializer().dumps([nonce, self._digest(nonce, code)])
+
+    def verify(self, code, secret):
+        ttl = app.config['CAPTCHA']['ttl'] * 3600
+
+        try:
+            nonce, digest = self._serializer().loads(secret, max_age=ttl)
+        except (BadSignature, TypeError, ValueError):
+            return False
+
+        if not isinstance(code, str) or not hmac.compare_digest(digest, self._digest(nonce, code)):
+            return False
+
+        return self.used.add(nonce, ttl)
+
+    def sweep(self):
+        return self.used.evict()
+
+    @staticmethod
+    def _serializer():
+        return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='captcha')
+
+    @staticmethod
+    def _digest(nonce, code):
+        key = app.config['SECRET_KEY'].encode('utf-8')
+        return hmac.new(key, f'{nonce}:{code}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def create_backend(config):
+    if config['backend'] == 'signed':
+        return SignedBackend()
+
+    return DatabaseBackend()
+
+
+captcha_backend = create_backend(app.config['CAPTCHA'])
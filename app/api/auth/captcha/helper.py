@@ -1,4 +1,5 @@
 import base64
+import functools
 import io
 
 from PIL import Image, ImageDraw, ImageFont
@@ -8,8 +9,8 @@ from app import app
 from app.helper import generate_random_string
 
 
-def captcha_response(captcha):
-    return make_response(jsonify(captcha.json()), 200)
+def captcha_response(secret, image):
+    return make_response(jsonify({'secret': secret, 'image': image}), 200)
 
 
 def generate_captcha_code(code_length=None):
@@ -17,6 +18,11 @@ def generate_captcha_code(code_length=None):
     return generate_random_string(code_length)
 
 
+@functools.lru_cache(maxsize=4)
+def load_font(font_size):
+    return ImageFont.truetype('times.ttf', font_size)
+
+
 def generate_base64_image(code=None, font_size=None):
     if not code or not isinstance(code, str):
         raise ValueError('Code is not set or not a string.')
@@ -25,7 +31,7 @@ def generate_base64_image(code=None, font_size=None):
 
     image_prefix = "data:image/png;charset=utf-8;base64, "
 
-    font = ImageFont.truetype('times.ttf', font_size)
+    font = load_font(font_size)
     image_size = font.getsize(code)
 
     img = Image.new('RGB', (image_size[0], image_size[1] + 2), color='white')
@@ -0,0 +1,67 @@
+import sys
+import time
+from collections import deque
+
+from app import app, db
+from app.api.auth.captcha.backends import captcha_backend
+from app.api.auth.captcha.helper import generate_captcha_code, generate_base64_image
+from app.worker import BackgroundWorker
+
+
+class CaptchaPool:
+    """
+    In-process pool of pre-rendered captchas: (code, base64 image) pairs.
+
+    A background thread refills the pool up to `CAPTCHA['pool-size']` once it's half empty and deletes
+    outdated captchas (or replay records) every `CAPTCHA['sweep-interval']` seconds. A request finding the pool empty renders
+    its captcha inline.
+    """
+
+    def __init__(self):
+        self._captchas = deque()
+        self._swept = None
+        self._worker = BackgroundWorker('captcha-pool', self._maintain, 'Failed to refill captcha pool',
+                                        interval=lambda: app.config['CAPTCHA']['sweep-interval'])
+
+    def pop(self):
+        self._worker.start()
+
+        try:
+            captcha = self._captchas.popleft()
+        except IndexError:
+            captcha = None
+
+        if len(self._captchas) < app.config['CAPTCHA']['pool-size'] // 2:
+            self._worker.wake()
+
+        if captcha is None:
+            code = generate_captcha_code()
+            captcha = code, generate_base64_image(code)
+
+        return captcha
+
+    def refill(self):
+        while len(self._captchas) < app.config['CAPTCHA']['pool-size']:
+            code = generate_captcha_code()
+            self._captchas.append((code, generate_base64_image(code)))
+
+    def sweep(self):
+        with app.app_context():
+            try:
+                return captcha_backend.sweep()
+            finally:
+                db.session.remove()
+
+    def _maintain(self):
+        try:
+            self.refill()
+        finally:
+            if self._swept is None or time.monotonic() - self._swept >= app.config['CAPTCHA']['sweep-interval']:
+                self._swept = time.monotonic()
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f'Failed to delete outdated captchas: {e}', file=sys.stderr)
+
+
+captcha_pool = CaptchaPool()
@@ -1,16 +1,15 @@
 from flask import Blueprint
 
-from app import app
+from app.api.auth.captcha.backends import captcha_backend
 from app.api.auth.captcha.helper import captcha_response
-from app.models import CaptchaCode
+from app.api.auth.captcha.pool import captcha_pool
 
 api_captcha = Blueprint('api_captcha', __name__)
 
 
 @api_captcha.route('/api/auth/captcha', methods=['GET'])
 def get_captcha():
-    CaptchaCode.delete_outdated_captchas(app.config['CAPTCHA']['ttl'])
+    code, image = captcha_pool.pop()
+    secret = captcha_backend.issue(code, image)
 
-    captcha = CaptchaCode()
-
-    return captcha_response(captcha.save())
+    return captcha_response(secret, image)
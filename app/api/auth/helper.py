@@ -1,11 +1,13 @@
 import types
 from functools import wraps
 
-from flask import g
+from flask import g, session
 
+from app.api.auth.passwords import HashingUnavailable
 from app.api.helper import response
+from app.api.post.counts import moderation_queue
 from app.api.validators import validate_email_and_user_is_not_registered, validate_password
-from app.models import User, Post
+from app.models import User
 
 
 def login_response(user):
@@ -16,8 +18,26 @@ def login_error_response(message=None, errors=None):
     return response(False, 400, message=message, errors=errors)
 
 
-def authorized_user_response(user_id):
-    return login_response(User.query.get(user_id))
+def authorized_user_response(user):
+    if 'name' not in user:
+        # Session issued before the profile was kept in it
+        user = session['user'] = session_user(User.query.get(user['id']))
+    return login_response(types.SimpleNamespace(**user))
+
+
+def session_user_version():
+    """
+    Validator inputs of `/api/auth/check`: the session user and the moderation queue shown to moderators
+    """
+    user = g.user
+
+    if not user:
+        return (False,)
+    if 'name' not in user:
+        # Session issued before the profile was kept in it: the user is loaded anyway
+        return None
+
+    return sorted(user.items()), get_posts_awaiting_moderation() if user['is_moderator'] else None
 
 
 def unauthorized_user_response():
@@ -52,11 +72,35 @@ def validate_login_request(data):
         if not user.is_valid_password(data.password):
             errors['password'] = "Either username or password are incorrect."
         else:
+            rehash_password(user, data.password)
             return None, user
 
     return errors, None
 
 
+def session_user(user):
+    """
+    Part of the user kept in the session, enough to answer `/api/auth/check` without loading the user
+    """
+    return dict(id=user.id, email=user.email, is_moderator=user.is_moderator, name=user.name, photo=user.photo)
+
+
+def rehash_password(user, password):
+    """
+    Re-hashes the password after `BCRYPT_LOG_ROUNDS` changed. Best effort: the login succeeds anyway
+    and the hash is upgraded on one of the next logins if there's no free hashing capacity right now.
+    """
+    if not user.needs_rehash():
+        return
+
+    try:
+        user.password = password
+    except HashingUnavailable:
+        return
+
+    user.save()
+
+
 def is_authorized():
     return True if g.user else False
 
@@ -65,14 +109,11 @@ def get_posts_awaiting_moderation():
     """
     Counts total number of posts to be moderated by any moderator, e.g.
       `isActive = 1` AND `moderationStatus = NEW` AND `moderatedBy = NULL`
-    Query:
+    Query (run once per `MODERATION_QUEUE['ttl']`, the counter is maintained in memory in between):
       SELECT COUNT (*) FROM posts p WHERE p.is_active = 1 AND p.moderation_status = 'NEW' AND p.moderator_id IS NULL
     :return: int Total amount of posts to be moderated
     """
-    return Post.query.filter(
-        Post.is_active,
-        Post.moderation_status == 'NEW',
-        Post.moderator_id.is_(None)).count()
+    return moderation_queue.get()
 
 
 def user_dto(user):
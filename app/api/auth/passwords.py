@@ -0,0 +1,46 @@
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+from app import app
+from app.pool import ProcessPool
+
+
+class HashingUnavailable(ServiceUnavailable):
+    description = "Too many authentication requests at the moment, please try again later."
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a dedicated process pool (`PASSWORD_HASHING`), so a burst of logins can't pin
+    the request threads: jobs over the pool's capacity or timeout fail fast with 503.
+    """
+
+    def __init__(self):
+        self._pool = ProcessPool('PASSWORD_HASHING', HashingUnavailable)
+
+    def hash(self, password, rounds=None):
+        return self._pool.run(_hash, password, rounds or app.config['BCRYPT_LOG_ROUNDS'])
+
+    def check(self, pw_hash, password):
+        return self._pool.run(_check, pw_hash, password)
+
+    @staticmethod
+    def needs_rehash(pw_hash, rounds=None):
+        """
+        Whether the hash was made with other than the configured number of rounds, e.g. `$2b$08$...`
+        """
+        try:
+            return int(pw_hash.split('$')[2]) != (rounds or app.config['BCRYPT_LOG_ROUNDS'])
+        except (IndexError, ValueError):
+            return True
+
+
+password_hasher = PasswordHasher()
@@ -30,3 +30,8 @@ def register_user():
 @api_register.errorhandler(400)
 def handle_400_error(e):
     return error_response(e)
+
+
+@api_register.errorhandler(503)
+def handle_503_error(e):
+    return error_response(e)
@@ -1,12 +1,9 @@
-from flask import abort
-from flask_mail import Message
-
-from app import mail
 from app.api.helper import response
 from app.api.validators import (validate_password,
                                 validate_captcha,
                                 validate_code,
                                 validate_email_and_user_is_not_registered)
+from app.outbox import mail_outbox
 
 
 def restore_response(email):
@@ -37,10 +34,8 @@ def validate_password_request(data):
 
 
 def send_email(recipient, subject, message):
-    try:
-        msg = Message(subject)
-        msg.add_recipient(recipient)
-        msg.body = message
-        mail.send(msg)
-    except Exception as e:
-        abort(503, e)
+    """
+    Queues the message into the mail outbox, it's stored by the next commit of the DB session and sent
+    in the background then
+    """
+    mail_outbox.put(recipient, subject, message)
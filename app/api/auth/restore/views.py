@@ -12,6 +12,7 @@ from app.api.auth.restore.helper import (
 )
 from app.api.helper import check_request, error_response
 from app.models import User
+from app.outbox import mail_outbox
 
 api_restore_password = Blueprint('api_restore', __name__)
 
@@ -27,6 +28,10 @@ def restore():
 
     code = str(uuid.uuid4())
 
+    user = User.get_by_email(data.email)
+    user.code = code
+
+    # Stored in the same transaction as the code
     send_email(
         recipient=data.email,
         subject='Ссылка для восстановления пароля',
@@ -34,9 +39,8 @@ def restore():
                 f'{request.host_url}login/change-password/{code}'
     )
 
-    user = User.get_by_email(data.email)
-    user.code = code
     user.save()
+    mail_outbox.wake()
 
     return restore_response(user.email)
 
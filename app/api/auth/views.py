@@ -5,8 +5,11 @@ from app.api.auth.helper import (login_error_response,
                                  login_response,
                                  logout_response,
                                  unauthorized_user_response,
-                                 authorized_user_response)
-from app.api.helper import check_request
+                                 authorized_user_response,
+                                 session_user,
+                                 session_user_version)
+from app.api.cache import conditional
+from app.api.helper import check_request, error_response
 
 api_auth = Blueprint('api_auth', __name__)
 
@@ -22,14 +25,15 @@ def login():
 
     if 'user' not in session:
         session.permanent = True
-        session['user'] = dict(id=user.id, email=user.email, is_moderator=user.is_moderator)
+        session['user'] = session_user(user)
 
     return login_response(user)
 
 
 @api_auth.route('/api/auth/check', methods=['GET'])
+@conditional(session_user_version)
 def check():
-    return authorized_user_response(g.user.get('id')) if g.user else unauthorized_user_response()
+    return authorized_user_response(g.user) if g.user else unauthorized_user_response()
 
 
 @api_auth.route('/api/auth/logout', methods=['GET'])
@@ -41,3 +45,8 @@ def logout():
 @api_auth.errorhandler(400)
 def handle_400_error(e):
     return login_error_response(message=e.description)
+
+
+@api_auth.errorhandler(503)
+def handle_503_error(e):
+    return error_response(e)
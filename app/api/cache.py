@@ -0,0 +1,224 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, current_app, Response
+
+from app import app
+
+
+class MemoryBackend:
+    """
+    In-process LRU backend. Each worker process keeps its own entries, so invalidations made by one
+    worker reach the others only through the entries' TTL.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._token = os.urandom(4).hex()
+
+    @property
+    def scope(self):
+        """
+        Counters are only comparable within the same process (and its lifetime)
+        """
+        return f'{os.getpid()}:{self._token}'
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counters(self, keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    """
+    Backend shared by all workers. Takes any client with redis-py's `get`, `set`, `mget` & `incr` methods,
+    so a local stand-in can be passed instead of a real server.
+    """
+
+    def __init__(self, client, prefix='blogapp:'):
+        self.client = client
+        self.prefix = prefix
+        self.scope = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+
+    def get_counters(self, keys):
+        return [int(value or 0) for value in self.client.mget([self.prefix + key for key in keys])]
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+def create_backend(config):
+    if config['backend'] == 'redis':
+        import redis
+        return RedisBackend(redis.Redis.from_url(config['url']))
+
+    return MemoryBackend(config['max-entries'])
+
+
+class ResponseCache:
+    """
+    Cache of public GET responses keyed by route & normalized query arguments.
+
+    Every entry is bound to tags, e.g. 'posts' or 'post:1': the key embeds the current version of each tag,
+    and invalidating a tag bumps its version, so stale entries are never hit again and just age out.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_backend(app.config['RESPONSE_CACHE'])
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def cached(self, *tags, ttl=None):
+        """
+        Caches successful responses of the decorated view. Tags may refer to the view arguments,
+        e.g. 'post:{post_id}'.
+        """
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if not app.config['RESPONSE_CACHE']['enabled']:
+                    return f(*args, **kwargs)
+
+                entry_tags = [tag.format(**kwargs) for tag in tags]
+                key = self._key(entry_tags)
+                entry = self.backend.get(key)
+
+                if entry is not None:
+                    return self._load(entry)
+
+                rv = current_app.make_response(f(*args, **kwargs))
+
+                if rv.status_code == 200 and not rv.direct_passthrough:
+                    # ETag is computed once per entry: conditional requests for cached responses
+                    # are answered with 304 without rebuilding and rehashing the body
+                    rv.add_etag()
+                    self.backend.set(key, self._dump(rv), ttl or app.config['RESPONSE_CACHE']['ttl'])
+                    rv.headers['X-Cache'] = 'MISS'
+
+                return rv
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr('tag:' + tag)
+
+    def versions(self, *tags):
+        """
+        Validator inputs of responses depending on the tags: their versions and the current TTL window, as
+        changes made without an invalidation (e.g. scheduled posts, other workers' writes with the memory
+        backend) reach the cached responses once per TTL as well
+        """
+        ttl = app.config['RESPONSE_CACHE']['ttl']
+        versions = self.backend.get_counters(['tag:' + tag for tag in tags])
+
+        return (self.backend.scope, int(time.time() // ttl), *versions)
+
+    def _key(self, tags):
+        versions = self.backend.get_counters(['tag:' + tag for tag in tags])
+        tag_versions = ','.join(f'{tag}={version}' for tag, version in zip(tags, versions))
+
+        return f'response:{request_key()}|{tag_versions}'
+
+    @staticmethod
+    def _dump(rv):
+        etag, _ = rv.get_etag()
+        return f'{rv.status_code}\n{rv.mimetype}\n{etag}\n'.encode() + rv.get_data()
+
+    @staticmethod
+    def _load(entry):
+        status, mimetype, etag, body = entry.split(b'\n', 3)
+        rv = Response(body, status=int(status), mimetype=mimetype.decode())
+        rv.set_etag(etag.decode())
+        rv.headers['X-Cache'] = 'HIT'
+        return rv
+
+
+def request_key():
+    """
+    Route & normalized query arguments of the current request
+    """
+    args = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    return f'{request.path}?{args}'
+
+
+def conditional(validator):
+    """
+    Answers conditional GETs of the decorated view before it does any work. `validator` takes the view
+    arguments and returns cheap inputs the response depends on (version counters, the session user, ...),
+    or None if there are none; the ETag is their hash along with the route & query arguments. A matching
+    `If-None-Match` gets 304 right away, otherwise the view's response carries the same ETag. Responses
+    without validator inputs are left to the ETag of the body set in `after_request`.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            inputs = validator(*args, **kwargs)
+
+            if inputs is None:
+                return f(*args, **kwargs)
+
+            etag = hashlib.sha1(f'{request_key()}|{inputs!r}'.encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                rv = Response(status=304)
+                rv.set_etag(etag)
+                return rv
+
+            # Inputs are taken before the view reads the data, so a concurrent change can only make
+            # the ETag older than the body, i.e. the next request gets a full response
+            rv = current_app.make_response(f(*args, **kwargs))
+
+            if rv.status_code == 200 and not rv.direct_passthrough:
+                rv.set_etag(etag)
+
+            return rv
+        return wrapper
+    return decorator
+
+
+response_cache = ResponseCache()
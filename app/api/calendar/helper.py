@@ -1,35 +1,80 @@
+from datetime import datetime, date, time
+
 from flask import make_response, jsonify
 
 from app import db
-from app.models import Post
+from app.models import Post, PostCalendar
 
 
 def calendar_response(year):
     return make_response(jsonify(calendar_dto(year)), 200)
 
 
-def get_years():
-    years = Post.active_posts \
+def count_published_today():
+    """
+    Rollup counts scheduled posts as well, so today's posts are counted live: it's an indexed range scan
+    """
+    now = datetime.now()
+    return Post.active_posts.filter(Post.time >= datetime.combine(now.date(), time.min)).count()
+
+
+def get_years(published_today=0):
+    years = PostCalendar.query \
+        .filter(PostCalendar.date < date.today(), PostCalendar.count > 0) \
         .group_by('years') \
-        .order_by(db.desc(Post.time)) \
-        .values(db.func.year(Post.time).label('years'))
+        .order_by(db.desc('years')) \
+        .values(db.func.year(PostCalendar.date).label('years'))
+
+    years = [year for year, in years]
+
+    if published_today and date.today().year not in years:
+        years.insert(0, date.today().year)
+
+    return years
+
+
+def posts_by_date(year, published_today=0):
+    query = PostCalendar.query \
+        .filter(PostCalendar.date < date.today(), PostCalendar.count > 0) \
+        .order_by(db.desc(PostCalendar.date))
 
-    return list(zip(*years)).pop()
+    days = query if not year else query.filter(PostCalendar.date.between(date(year, 1, 1), date(year, 12, 31)))
 
+    posts = {day.date.strftime('%Y-%m-%d'): day.count for day in days.all()}
 
-def posts_by_date(year):
-    query = Post.active_posts.with_entities(
-        db.func.date_format(Post.time, '%Y-%m-%d').label('date'),
-        db.func.count('*').label('count')
-    ).group_by('date').order_by(db.desc(Post.time))
+    if published_today and (not year or year == date.today().year):
+        posts = {date.today().strftime('%Y-%m-%d'): published_today, **posts}
 
-    posts = query if not year else query.filter(db.func.year(Post.time) == year)
+    return posts
 
-    return {post.date: post.count for post in posts.all()}
+
+def calendar_state(post):
+    """
+    Rollup day the post is counted in, if it's counted at all
+    """
+    return post.time.date() if post.is_active and post.moderation_status == 'ACCEPTED' else None
+
+
+def update_calendar(old_state, post):
+    """
+    Moves the post between the rollup days according to its state before & after the change
+    """
+    new_state = calendar_state(post)
+
+    if old_state == new_state:
+        return
+
+    if old_state:
+        PostCalendar.shift(old_state, -1)
+
+    if new_state:
+        PostCalendar.shift(new_state, 1)
 
 
 def calendar_dto(year):
+    published_today = count_published_today()
+
     return {
-        'years': get_years(),
-        'posts': posts_by_date(year)
+        'years': get_years(published_today),
+        'posts': posts_by_date(year, published_today)
     }
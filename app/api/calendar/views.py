@@ -2,12 +2,15 @@ from datetime import datetime
 
 from flask import Blueprint, request
 
+from app.api.cache import response_cache, conditional
 from app.api.calendar.helper import calendar_response
 
 api_calendar = Blueprint('api_calendar', __name__)
 
 
 @api_calendar.route('/api/calendar', methods=['GET'])
+@conditional(lambda: response_cache.versions('calendar'))
+@response_cache.cached('calendar')
 def get_calendar():
     year = request.args.get('year', None, type=int)
 
@@ -2,8 +2,15 @@ import types
 
 from flask import make_response, jsonify, abort, current_app, request
 
+from app import db
+from app.api.cache import response_cache
+from app.api.calendar.helper import calendar_state, update_calendar
+from app.api.post.counts import post_counts, moderation_queue
+from app.api.settings import settings_cache
+from app.api.tag.cloud import tag_cloud
 from app.api.validators import validate_text
 from app.models import Settings, Post, Comment
+from app.search.index import search_index
 from app.tg.client import send_telegram_message
 from app.tg.helper import escape
 
@@ -78,14 +85,29 @@ def process_moderation_request(post, moderator_id, status):
         return abort(403)
 
     old_status = post.moderation_status
+    old_calendar_state = calendar_state(post)
+    old_moderation_state = moderation_queue.state(post)
     post.moderation_status = status
     post.moderator_id = moderator_id
+    update_calendar(old_calendar_state, post)
     post.save()
+    moderation_queue.update(old_moderation_state, post)
+    after_post_saved(post)
 
     return response(True, 200, message=f"Status for post id={post.id} successfully updated from "
                                        f"'{old_status}' to '{post.moderation_status}'.")
 
 
+def after_post_saved(post):
+    """
+    Keeps the derived data in line with the saved post: caches, search index & tag cloud
+    """
+    post_counts.invalidate()
+    search_index.update_post(post)
+    tag_cloud.update_post(post)
+    response_cache.invalidate('posts', f'post:{post.id}', 'tags', 'calendar', 'statistics')
+
+
 """
 Settings
 """
@@ -96,10 +118,12 @@ def is_valid_settings_request(data):
 
 
 def save_settings(data):
-    for code, value in data.__dict__.items():
-        option = Settings.query.filter_by(code=code).first()
-        option.value = 'YES' if value else 'NO'
-        option.save()
+    for option in Settings.query.filter(Settings.code.in_(data.__dict__)).all():
+        option.value = 'YES' if getattr(data, option.code) else 'NO'
+
+    db.session.commit()
+
+    settings_cache.invalidate()
 
 
 """
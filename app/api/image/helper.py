@@ -1,40 +1,80 @@
+import glob
 import os
 
-from werkzeug.utils import secure_filename
+from werkzeug.exceptions import ServiceUnavailable
 
 from app import app
-from app.helper import generate_random_string
+from app.api.image.processing import probe_image, render_derivatives
+from app.api.image.storage import storage
+from app.pool import ProcessPool
+
+
+class ImageProcessingUnavailable(ServiceUnavailable):
+    description = "Too many images are being processed at the moment, please try again later."
+
+
+image_pool = ProcessPool('IMAGES', ImageProcessingUnavailable)
 
 
 def upload_file(file):
-    upload_dir = app.config['UPLOAD_DIR']
-    filename = secure_filename(file.filename)
+    """
+    Stores the uploaded image re-encoded at its original size & as derivatives of `IMAGES['derivatives']` widths.
+    The same file uploaded once more refers to the already stored derivatives. The reference is added
+    to the current transaction, the caller commits it.
+    :return: {'original' / derivative name: {ext: url}}, e.g. {'avatar': {'png': '/upload/../image-avatar.png',
+             'webp': '/upload/../image-avatar.webp'}, ...}
+    """
+    config = app.config['IMAGES']
 
-    path = [generate_random_string().lower() for _ in range(3)]
-    path = os.path.join(upload_dir, *path)
+    def render(source_path, base_path):
+        return image_pool.run(render_derivatives, source_path, base_path,
+                              config['derivatives'], config['quality'], config['webp'])
 
-    os.makedirs(path, exist_ok=True)
+    return storage.store(file, render)
 
-    full_path = os.path.join(path, filename)
-    file.save(full_path)
 
-    return '/' + get_relative_path(upload_dir, full_path).replace('\\', '/')
+def image_url(derivatives, name):
+    """
+    URL of the derivative in the uploaded image's own format, of the original if the derivative isn't configured
+    in `IMAGES['derivatives']` (or wasn't when the file was stored)
+    """
+    urls = derivatives.get(name) or derivatives['original']
+    return next(url for ext, url in urls.items() if ext != 'webp')
 
 
 def remove_file(file):
+    """
+    Releases the uploaded image by the URL of any of its derivatives: the files are removed with the last reference,
+    once the caller commits. Files uploaded before the storage was content-addressed are removed right away.
+    """
+    if storage.release(file):
+        return
+
     photo = os.path.join(app.config['APP_ROOT_DIR'], os.path.normpath(file)[1:])
+    base_path = os.path.splitext(photo)[0]
+    suffixes = [''] + [f'-{name}' for name in app.config['IMAGES']['derivatives']]
 
-    try:
-        os.remove(photo)
-    except OSError:
-        pass
+    for suffix in suffixes[1:]:
+        if base_path.endswith(suffix):
+            base_path = base_path[:-len(suffix)]
+            break
 
+    paths = {photo}
+    for suffix in suffixes:
+        paths.update(glob.glob(glob.escape(base_path + suffix) + '.*'))
 
-def allowed_file(file):
-    return '.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 
-def get_relative_path(base_path, path):
-    return os.path.normpath(
-        os.path.join(os.path.basename(base_path),
-                     os.path.relpath(path, base_path)))
+def allowed_file(file):
+    """
+    Checks the extension and decodes the image header: accepted formats & no more than `IMAGES['max-pixels']`
+    """
+    if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in app.config['ALLOWED_EXTENSIONS']:
+        return False
+
+    return probe_image(file.stream, app.config['IMAGES']['max-pixels']) is not None
@@ -0,0 +1,81 @@
+import shutil
+
+from PIL import Image, ImageOps
+
+# Pillow format > file extension of the formats accepted for upload
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+def probe_image(stream, max_pixels):
+    """
+    Decodes the image header only and rewinds the stream.
+    :return: (format, width, height) or None if it's not an image of the accepted formats and size
+    """
+    try:
+        with Image.open(stream) as img:
+            image_format, (width, height) = img.format, img.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        stream.seek(0)
+
+    if image_format not in FORMATS or not 0 < width * height <= max_pixels:
+        return None
+
+    return image_format, width, height
+
+
+def render_derivatives(source_path, base_path, widths, quality=85, webp=True):
+    """
+    Decodes the uploaded image and writes its re-encoded copies next to `base_path`: `<base>.<ext>` at
+    the original size and `<base>-<name>.<ext>` no wider than each of `widths` {name: px}, also as `.webp`.
+    Metadata isn't copied: the EXIF orientation is applied to the pixels and everything else is dropped.
+
+    Animated images are stored as is, every derivative refers to the original then.
+    :return: {'original' / name: {ext: path}}
+    """
+    with Image.open(source_path) as img:
+        ext = FORMATS[img.format]
+
+        if getattr(img, 'is_animated', False):
+            shutil.copyfile(source_path, f'{base_path}.{ext}')
+            original = {ext: f'{base_path}.{ext}'}
+            return dict({name: original for name in widths}, original=original)
+
+        image = ImageOps.exif_transpose(img)
+        image_format = img.format
+        derivatives = {}
+
+        for name, width in [('original', None)] + sorted(widths.items(), key=lambda item: item[1]):
+            path = base_path if name == 'original' else f'{base_path}-{name}'
+            resized = resize(image, width)
+
+            derivatives[name] = {ext: save_image(resized, f'{path}.{ext}', image_format, quality)}
+            if webp:
+                derivatives[name]['webp'] = save_image(resized, f'{path}.webp', 'WEBP', quality)
+
+        return derivatives
+
+
+def resize(image, width):
+    if width is None or image.width <= width:
+        return image
+
+    return image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+
+
+def save_image(image, path, image_format, quality):
+    options = {}
+
+    if image_format == 'JPEG':
+        image = image if image.mode in ('RGB', 'L') else image.convert('RGB')
+        options = dict(quality=quality, optimize=True, progressive=True)
+    elif image_format == 'PNG':
+        options = dict(optimize=True)
+    elif image_format == 'WEBP':
+        image = image if image.mode in ('RGB', 'RGBA') else image.convert('RGBA')
+        options = dict(quality=quality, method=4)
+
+    image.save(path, image_format, **options)
+
+    return path
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from app.models import Upload
+
+
+class LocalBackend:
+    """
+    Files under the upload directory, served by the app at `/<upload dir name>/<key>`
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, path):
+        target = os.path.join(self.root, *key.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, *key.split('/')))
+        except OSError:
+            pass
+
+    def url(self, key):
+        return f'/{os.path.basename(self.root)}/{key}'
+
+
+class S3Backend:
+    """
+    Bucket of an S3-compatible storage. Takes any client with boto3's `upload_file` & `delete_object` methods,
+    so a local stand-in (e.g. MinIO) can be used instead of the real service.
+    """
+
+    def __init__(self, client, bucket, public_url):
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+
+    def put(self, key, path):
+        self.client.upload_file(path, self.bucket, key)
+        os.remove(path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key):
+        return f'{self.public_url}/{key}'
+
+
+def create_backend(config):
+    if config['backend'] == 's3':
+        import boto3
+        client = boto3.client('s3', endpoint_url=config['url'])
+        return S3Backend(client, config['bucket'], config['public-url'])
+
+    return LocalBackend(app.config['UPLOAD_DIR'])
+
+
+class UploadStorage:
+    """
+    Content-addressed storage of uploaded images: the upload is streamed to a temporary file while hashing,
+    and its derivatives are stored under `<hash[:2]>/<hash[2:4]>/<hash>/` once, no matter how many times
+    the same file is uploaded. Every upload adds a reference, files are deleted with the last one released.
+
+    References are counted in the caller's transaction, which the caller commits: files of the released uploads
+    are deleted once it's committed, files of the new ones are deleted if it isn't.
+    """
+
+    # URL path of a stored file: .../ab/cd/<hash>/image[-<derivative>].<ext>
+    KEY_PATTERN = re.compile(r'/([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})/[\w-]+\.\w+$')
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_backend(app.config['STORAGE'])
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def store(self, file, render):
+        """
+        Stores the uploaded file. `render(source path, base path)` makes the derivatives of a new upload and
+        returns {derivative: {ext: path}}, paths starting with the base path. Doesn't commit.
+        :return: {derivative: {ext: url}}
+        """
+        work_dir = tempfile.mkdtemp(dir=self._tmp_dir())
+
+        try:
+            source_path = os.path.join(work_dir, 'upload')
+            content_hash = self._save(file, source_path)
+
+            upload = Upload.acquire(content_hash)
+
+            if upload is None:
+                files = self._put(content_hash, render(source_path, os.path.join(work_dir, 'image')))
+                try:
+                    with db.session.begin_nested():
+                        upload = Upload(hash=content_hash, files=json.dumps(files))
+                        db.session.add(upload)
+                except IntegrityError:
+                    # Stored meanwhile by a concurrent upload of the same file: the files are identical & theirs
+                    upload = Upload.acquire(content_hash)
+                else:
+                    self._pending(db.session)['put'].update(self._keys(files))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return self.urls(upload)
+
+    def release(self, url):
+        """
+        Drops a reference to the stored file by the URL of any of its derivatives. Doesn't commit.
+        :return: False if the URL doesn't belong to the storage
+        """
+        match = self.KEY_PATTERN.search(url or '')
+
+        if not match:
+            return False
+
+        upload = Upload.release(match.group(3))
+
+        if upload is not None:
+            self._pending(db.session)['delete'].update(self._keys(json.loads(upload.files)))
+
+        return True
+
+    def urls(self, upload):
+        return {derivative: {ext: self.backend.url(key) for ext, key in files.items()}
+                for derivative, files in json.loads(upload.files).items()}
+
+    """
+    Transaction hooks
+    """
+
+    def after_commit(self, session):
+        if session.transaction.nested:
+            return
+
+        pending = session.info.pop('upload-storage', None)
+        if pending is not None:
+            self._delete(pending['delete'])
+
+    def after_transaction_end(self, session, transaction):
+        # Not committed (rolled back or discarded): nothing refers to the files of the new uploads
+        if transaction.parent is None:
+            pending = session.info.pop('upload-storage', None)
+            if pending is not None:
+                self._delete(pending['put'])
+
+    @staticmethod
+    def _pending(session):
+        return session.info.setdefault('upload-storage', {'put': set(), 'delete': set()})
+
+    def _delete(self, keys):
+        for key in keys:
+            try:
+                self.backend.delete(key)
+            except Exception as e:
+                print(f'Failed to delete stored file {key}: {e}', file=sys.stderr)
+
+    @staticmethod
+    def _keys(files):
+        return {key for derivative in files.values() for key in derivative.values()}
+
+    def _save(self, file, path):
+        content_hash = hashlib.sha256()
+        chunk_size = app.config['STORAGE']['chunk-size']
+
+        with open(path, 'wb') as f:
+            for chunk in iter(lambda: file.stream.read(chunk_size), b''):
+                content_hash.update(chunk)
+                f.write(chunk)
+
+        return content_hash.hexdigest()
+
+    def _put(self, content_hash, derivatives):
+        prefix = f'{content_hash[:2]}/{content_hash[2:4]}/{content_hash}'
+        keys, files = {}, {}
+
+        for derivative, paths in derivatives.items():
+            files[derivative] = {}
+            for ext, path in paths.items():
+                # Derivatives may share a file, e.g. all of them refer to the original of an animated image
+                if path not in keys:
+                    keys[path] = f'{prefix}/{os.path.basename(path)}'
+                    self.backend.put(keys[path], path)
+                files[derivative][ext] = keys[path]
+
+        return files
+
+    @staticmethod
+    def _tmp_dir():
+        path = app.config['STORAGE']['tmp-dir']
+        os.makedirs(path, exist_ok=True)
+        return path
+
+
+storage = UploadStorage()
+
+event.listen(db.session, 'after_commit', storage.after_commit)
+event.listen(db.session, 'after_transaction_end', storage.after_transaction_end)
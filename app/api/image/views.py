@@ -1,8 +1,9 @@
-from flask import Blueprint, request, abort
+from flask import Blueprint, request, abort, jsonify
 
+from app import db
 from app.api.auth.helper import auth_required
 from app.api.helper import error_response
-from app.api.image.helper import allowed_file, upload_file
+from app.api.image.helper import allowed_file, upload_file, image_url
 
 api_image = Blueprint('api_image', __name__)
 
@@ -22,11 +23,15 @@ def upload_image(user):
         abort(400, 'Wrong file type. Only images allowed.')
 
     try:
-        image_path = upload_file(file)
+        derivatives = upload_file(file)
+        db.session.commit()
     except OSError as e:
         abort(500, e)
     else:
-        return image_path, 200
+        # The editor inserts the plain URL as is, API clients may ask for all the derivatives
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(derivatives), 200
+        return image_url(derivatives, 'content'), 200
 
 
 @api_image.errorhandler(400)
@@ -34,6 +39,11 @@ def handle_400_error(e):
     return error_response(e)
 
 
+@api_image.errorhandler(503)
+def handle_503_error(e):
+    return error_response(e)
+
+
 @api_image.errorhandler(500)
 def handle_500_error(e):
     return error_response(e)
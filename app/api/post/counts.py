@@ -0,0 +1,133 @@
+import threading
+import time
+from datetime import datetime
+
+from app import app, db
+from app.models import Post
+
+
+class CountCache:
+    """
+    In-process cache of post list totals keyed by (endpoint, mode/filter, query).
+
+    Entries live for `POSTS_COUNT_CACHE['ttl']` seconds at most and are dropped all at once on post saves &
+    moderation. Scheduled posts change the totals without any write, so every entry also expires at the
+    nearest scheduled publication time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._generation = 0
+        self._next_publication = None
+        self._next_publication_known = False
+
+    def get(self, key, counter):
+        now = time.monotonic()
+
+        with self._lock:
+            if self._next_publication_known and self._next_publication and self._next_publication <= datetime.now():
+                self._reset()
+
+            entry = self._counts.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            generation = self._generation
+
+        count = counter()
+        expires = now + app.config['POSTS_COUNT_CACHE']['ttl']
+
+        with self._lock:
+            # Don't store a total computed before a concurrent invalidation
+            if generation == self._generation:
+                self._counts[key] = (count, expires)
+
+        if not self._next_publication_known:
+            self._load_next_publication(generation)
+
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._generation += 1
+        self._counts.clear()
+        self._next_publication = None
+        self._next_publication_known = False
+
+    def _load_next_publication(self, generation):
+        next_publication = Post.query.filter(
+            Post.is_active,
+            Post.moderation_status == 'ACCEPTED',
+            Post.time > datetime.now()
+        ).value(db.func.min(Post.time))
+
+        with self._lock:
+            if generation == self._generation:
+                self._next_publication = next_publication
+                self._next_publication_known = True
+
+
+post_counts = CountCache()
+
+
+class ModerationQueue:
+    """
+    Number of posts awaiting moderation, shown to moderators on every `/api/auth/check`.
+
+    The counter is adjusted in place by post saves & moderation decisions made by this worker and is recounted
+    every `MODERATION_QUEUE['ttl']` seconds to pick up the ones made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = None
+        self._expires = 0
+        self._generation = 0
+
+    def get(self):
+        now = time.monotonic()
+
+        with self._lock:
+            if self._count is not None and self._expires > now:
+                return self._count
+            generation = self._generation
+
+        count = Post.query.filter(
+            Post.is_active,
+            Post.moderation_status == 'NEW',
+            Post.moderator_id.is_(None)).count()
+
+        with self._lock:
+            # A counter shifted meanwhile may or may not be included in the total, so it's recounted next time
+            if generation == self._generation:
+                self._count = count
+                self._expires = now + app.config['MODERATION_QUEUE']['ttl']
+
+        return count
+
+    @staticmethod
+    def state(post):
+        """
+        Whether the post is in the queue, to be captured before the post is changed
+        """
+        return bool(post.is_active and post.moderation_status == 'NEW' and post.moderator_id is None)
+
+    def update(self, old_state, post):
+        """
+        Shifts the counter according to the post's state before & after the committed change
+        """
+        delta = int(self.state(post)) - int(bool(old_state))
+
+        if not delta:
+            return
+
+        with self._lock:
+            self._generation += 1
+            if self._count is not None:
+                self._count = max(self._count + delta, 0)
+
+
+moderation_queue = ModerationQueue()
@@ -1,54 +1,111 @@
+import bisect
+import operator
 from datetime import datetime
 
-from flask import jsonify, make_response, request
+from flask import jsonify, make_response, request, abort
+from itsdangerous import URLSafeSerializer, BadSignature
 
-from app import db
-from app.api.helper import response
+from app import app, db
+from app.api.cache import response_cache
+from app.api.calendar.helper import calendar_state, update_calendar
+from app.api.helper import response, after_post_saved
+from app.api.post.counts import post_counts, moderation_queue
+from app.api.post.view_counter import view_counter
+from app.api.statistics.helper import statistics_state, update_statistics
 from app.api.validators import validate_title, validate_text
 from app.helper import clear_html_tags
-from app.models import Vote, Post, Comment, Tag
+from app.models import Vote, Post, Tag, Comment, Statistics
+from app.search.index import search_index
 from app.tg.client import send_telegram_message
 from app.tg.helper import escape
 
+CURSOR_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
 
 def post_response(post):
     return make_response(jsonify(full_post_dto(post)), 200)
 
 
-def posts_response(processor, items, total):
-    return make_response(jsonify({
-        'count': total,
-        'posts': processor(items)
-    }), 200)
+def posts_response(processor, items, total=None, next_cursor=None, cursor_mode=False):
+    payload = {'posts': processor(items)}
+
+    if total is not None:
+        payload['count'] = total
+
+    if cursor_mode:
+        payload['next'] = next_cursor
+
+    return make_response(jsonify(payload), 200)
+
+
+def paginated_posts_response(processor, items, keys, offset=None, limit=None, cursor=None,
+                             count_key=None, estimated=False):
+    """
+    Cursor (keyset) pagination is opt-in: it's used whenever `cursor` request parameter is passed,
+    an empty one stands for the first page. Otherwise the classic `offset/limit` contract is applied
+    with the total taken from the count cache by `count_key`.
+    """
+    if cursor is not None:
+        posts, next_cursor = paginate_by_cursor(cursor=cursor, limit=limit, items=items, keys=keys)
+        return posts_response(processor=processor, items=posts, next_cursor=next_cursor, cursor_mode=True)
+
+    posts, posts_total = paginate(offset=offset, limit=limit, items=items, count_key=count_key, estimated=estimated)
+
+    return posts_response(processor=processor, items=posts, total=posts_total)
 
 
 def get_active_posts(mode=None):
     return get_posts(mode).filter(*Post.active_posts_filter())
 
 
-def get_posts(mode=None):
-    orders = {
-        'recent': (db.desc(Post.time),),
-        'popular': (db.desc('commentCount'), db.desc(Post.time)),
-        'best': (db.desc('likeCount'), db.desc(Post.time)),
-        'early': (db.asc(Post.time),)
+def sort_keys(mode=None):
+    """
+    Sort keys of the post lists: columns (unique in total because of `Post.id`) & direction
+    """
+    keys = {
+        'recent': ((Post.time, Post.id), True),
+        'popular': ((Post.comment_count, Post.time, Post.id), True),
+        'best': ((Post.like_count, Post.time, Post.id), True),
+        'early': ((Post.time, Post.id), False)
     }
 
-    order = orders.get(mode, orders['recent'])
+    return keys.get(mode, keys['recent'])
+
+
+def get_posts(mode=None):
+    columns, descending = sort_keys(mode)
+    order = (db.desc(column) if descending else db.asc(column) for column in columns)
+
+    # Lists are built from the precomputed announce, so the whole text is only loaded, by the same query,
+    # for posts not backfilled yet. Authors are loaded by a single `IN` query per page.
+    return Post.query.options(
+        db.defer(Post.text),
+        db.with_expression(Post.announce_source, db.case([(Post.announce.is_(None), Post.text)])),
+        db.selectinload(Post.author)
+    ).order_by(*order)
+
 
-    likes = db.select([db.func.count(Vote.id)]).where(
-        db.and_(Vote.value == 1, Vote.post_id == Post.id)
-    ).as_scalar().label('likeCount')
+def get_full_post(post_id):
+    """
+    Loads post with everything `full_post_dto` needs in a constant number of queries
+    """
+    return Post.query.options(
+        db.joinedload(Post.author),
+        db.selectinload(Post.comments).joinedload(Comment.user),
+        db.selectinload(Post.tags)
+    ).filter(Post.id == post_id).first()
 
-    dislikes = db.select([db.func.count(Vote.id)]).where(
-        db.and_(Vote.value == -1, Vote.post_id == Post.id)
-    ).as_scalar().label('dislikeCount')
 
-    comments = db.select([db.func.count(Comment.id)]).where(
-        Comment.post_id == Post.id
-    ).as_scalar().label('commentCount')
+def post_version(post_id):
+    """
+    Validator inputs of a single post: its time & counters, loaded by the primary key, and the versions
+    of the post & its authors. Views are left out: flushing them bumps the post's version.
+    """
+    post = db.session.query(Post.time, Post.comment_count, Post.like_count, Post.dislike_count) \
+        .filter(Post.id == post_id).first()
 
-    return Post.query.with_entities(Post, likes, dislikes, comments).order_by(*order)
+    # A missing post is answered by the view
+    return (tuple(post), response_cache.versions(f'post:{post_id}', 'users')) if post else None
 
 
 def get_my_posts(user, status=None):
@@ -73,7 +130,7 @@ def get_moderated_posts(user, status=None):
 
     filter_criteria = statuses.get(status, statuses['new'])
 
-    return Post.query.filter(Post.is_active, *filter_criteria).order_by(db.desc(Post.time))
+    return get_posts().filter(Post.is_active, *filter_criteria)
 
 
 def filter_posts(query=None, query_type=None, items=None):
@@ -92,12 +149,125 @@ def filter_posts(query=None, query_type=None, items=None):
     return items.filter(query_filters[query_type])
 
 
-def paginate(offset=0, limit=10, items=None):
+def searched_posts_response(processor, query, offset=None, limit=None, cursor=None):
+    """
+    Full-text search by the in-process index: ranked ids are paginated in memory, so the total is exact
+    and only the posts of the page are loaded
+    """
+    results = search_index.search(query)
+    limit = limit if limit and limit > 0 else 10
+
+    if cursor is not None:
+        start = bisect.bisect_right([key for key, _ in results], decode_search_cursor(cursor)) if cursor else 0
+    else:
+        offset = offset if offset >= 0 else 0
+        start = offset // limit * limit
+
+    page = results[start:start + limit]
+    ids = [post_id for _, post_id in page]
+    posts = {post.id: post for post in get_active_posts().filter(Post.id.in_(ids))} if ids else {}
+    posts = [posts[post_id] for post_id in ids if post_id in posts]
+
+    if cursor is not None:
+        next_cursor = encode_search_cursor(page[-1][0]) if start + limit < len(results) else None
+        return posts_response(processor=processor, items=posts, next_cursor=next_cursor, cursor_mode=True)
+
+    return posts_response(processor=processor, items=posts, total=len(results))
+
+
+def paginate(offset=0, limit=10, items=None, count_key=None, estimated=False):
+    """
+    Returns a page of items and the total. The total is served by the count cache if `count_key` is set.
+    An `estimated` total skips `COUNT(*)` altogether: one extra row is fetched to find out whether
+    there's a next page, so the total is exact on the last page and a lower bound otherwise.
+    """
     offset = offset if offset >= 0 else 0
     limit = limit if limit > 0 else 10
-    page = offset // limit + 1
-    pagination = items.paginate(page=page, per_page=limit, error_out=False)
-    return pagination.items, pagination.total
+    offset = offset // limit * limit
+
+    def counter():
+        return items.order_by(None).count()
+
+    if estimated:
+        posts = items.offset(offset).limit(limit + 1).all()
+        return posts[:limit], offset + len(posts)
+
+    posts = items.offset(offset).limit(limit).all()
+
+    return posts, post_counts.get(count_key, counter) if count_key else counter()
+
+
+def paginate_by_cursor(cursor=None, limit=10, items=None, keys=None):
+    """
+    Keyset pagination: instead of `OFFSET` scan & `COUNT(*)` seeks right after the sort key of the last row
+    of the previous page. Fetches one extra row to find out whether there's a next page.
+    """
+    limit = limit if limit and limit > 0 else 10
+    columns, descending = keys
+
+    if cursor:
+        items = items.filter(keyset_filter(columns, decode_cursor(cursor, keys), descending))
+
+    posts = items.limit(limit + 1).all()
+    next_cursor = encode_cursor(posts[limit - 1], keys) if len(posts) > limit else None
+
+    return posts[:limit], next_cursor
+
+
+def keyset_filter(columns, values, descending):
+    """
+    Expands `(a, b, c) < (va, vb, vc)` into `a < va OR (a = va AND b < vb) OR (a = va AND b = vb AND c < vc)`
+    """
+    compare = operator.lt if descending else operator.gt
+
+    return db.or_(*(
+        db.and_(*(column == value for column, value in zip(columns[:i], values[:i])), compare(columns[i], values[i]))
+        for i in range(len(columns))
+    ))
+
+
+def cursor_serializer():
+    return URLSafeSerializer(app.config['SECRET_KEY'], salt='posts-cursor')
+
+
+def cursor_signature(keys):
+    columns, descending = keys
+    return ','.join(column.key for column in columns) + (':desc' if descending else ':asc')
+
+
+def encode_cursor(post, keys):
+    columns, _ = keys
+    values = [getattr(post, column.key) for column in columns]
+    values = [value.strftime(CURSOR_TIME_FORMAT) if isinstance(value, datetime) else value for value in values]
+
+    return cursor_serializer().dumps([cursor_signature(keys), values])
+
+
+def encode_search_cursor(key):
+    return cursor_serializer().dumps(['search', list(key)])
+
+
+def decode_search_cursor(cursor):
+    try:
+        signature, key = cursor_serializer().loads(cursor)
+        if signature != 'search' or len(key) != 3:
+            raise ValueError
+        return tuple(float(value) for value in key)
+    except (BadSignature, ValueError, TypeError):
+        abort(400, "Wrong cursor.")
+
+
+def decode_cursor(cursor, keys):
+    columns, _ = keys
+
+    try:
+        signature, values = cursor_serializer().loads(cursor)
+        if signature != cursor_signature(keys) or len(values) != len(columns):
+            raise ValueError
+        return [datetime.strptime(value, CURSOR_TIME_FORMAT) if isinstance(column.type, db.DateTime) else value
+                for column, value in zip(columns, values)]
+    except (BadSignature, ValueError, TypeError):
+        abort(400, "Wrong cursor.")
 
 
 """
@@ -111,10 +281,18 @@ def process_vote_and_get_response(post, user, value):
     if vote:
         if vote.value == value:
             return response(False, 200)
-        vote.delete()
+        Post.update_counters(post.id, **{Vote.counter_name(vote.value): -1, Vote.counter_name(value): 1})
+        Statistics.update_counters(user.id, **{Statistics.counter_name(vote.value): -1,
+                                               Statistics.counter_name(value): 1})
+        vote.value = value
+        vote.time = datetime.now()
+    else:
+        vote = Vote(post_id=post.id, user_id=user.id, value=value)
+        Post.update_counters(post.id, **{Vote.counter_name(value): 1})
+        Statistics.update_counters(user.id, **{Statistics.counter_name(value): 1})
 
-    vote = Vote(post_id=post.id, user_id=user.id, value=value)
     vote.save()
+    response_cache.invalidate('posts', f'post:{post.id}', 'statistics')
 
     return response(True, 200)
 
@@ -148,6 +326,8 @@ def validate_add_post_request(data):
 
     if check_tags and not all(isinstance(tag, str) for tag in data.tags):
         errors['tags'] = 'Неверное значение. Теги должны быть строками.'
+    elif check_tags and any(len(tag.strip()) > app.config['TAG']['max'] for tag in data.tags):
+        errors['tags'] = f"Тег слишком длинный. Максимальная длина: {app.config['TAG']['max']} символов."
 
     try:
         datetime.strptime(data.time, "%Y-%m-%dT%H:%M")
@@ -159,12 +339,16 @@ def validate_add_post_request(data):
 
 def save_post(post, author, data):
     post_to_save = post if post else Post()
+    old_calendar_state = calendar_state(post) if post else None
+    old_statistics_state = statistics_state(post) if post else None
+    old_moderation_state = moderation_queue.state(post) if post else False
 
     now = datetime.now()
     post_time = datetime.strptime(data.time, "%Y-%m-%dT%H:%M")
 
     post_to_save.title = data.title
     post_to_save.text = data.text
+    post_to_save.announce = make_announce(data.text)
     post_to_save.is_active = data.active
     post_to_save.time = now if post_time <= now else post_time
     post_to_save.author = author
@@ -173,28 +357,34 @@ def save_post(post, author, data):
         post_to_save.moderation_status = 'NEW'
 
     if data.tags:
-        update_post_tags(post_to_save.tags, data.tags)
+        update_post_tags(post_to_save, data.tags)
 
-    return post_to_save.save()
+    update_calendar(old_calendar_state, post_to_save)
+    update_statistics(old_statistics_state, post_to_save)
 
+    post_to_save = post_to_save.save()
+    moderation_queue.update(old_moderation_state, post_to_save)
+    after_post_saved(post_to_save)
 
-def update_post_tags(post_tags, updated_tags):
-    proposed_tags = set(updated_tags)
-    current_tags = set(tag.name for tag in post_tags)
+    return post_to_save
 
-    if current_tags != proposed_tags:
-        tags_to_delete = current_tags - proposed_tags
-        tags_to_add = proposed_tags - current_tags
 
-        if tags_to_delete:
-            update_tag_list(post_tags.remove, tags_to_delete)
+def make_announce(text, length=None):
+    length = length or app.config['ANNOUNCE']['length']
+    announce = clear_html_tags(text, length).rstrip()
 
-        if tags_to_add:
-            update_tag_list(post_tags.append, tags_to_add)
+    if len(announce) <= length:
+        return announce
 
+    return announce[:length].rsplit(' ', 1)[0].rstrip() + '...'
 
-def update_tag_list(list_action, items):
-    _ = [list_action(Tag.save_tag(tag_name)) for tag_name in items]
+
+def update_post_tags(post, updated_tags):
+    proposed_tags = Tag.normalize_names(updated_tags)
+    current_tags = set(tag.name.lower() for tag in post.tags)
+
+    if current_tags != set(tag_name.lower() for tag_name in proposed_tags):
+        post.tags = Tag.resolve_tags(proposed_tags)
 
 
 def notify_post_added(post):
@@ -214,10 +404,7 @@ Various Post Processors
 
 
 def posts_processor(items):
-    return [
-        simple_post_dto(post, int(num_likes), int(num_dislikes), int(num_comments))
-        for post, num_likes, num_dislikes, num_comments in items
-    ]
+    return [simple_post_dto(post) for post in items]
 
 
 def moderated_posts_processor(items):
@@ -248,10 +435,10 @@ def comment_dto(comment):
     }
 
 
-def simple_post_dto(post, num_likes=None, num_dislikes=None, num_comments=None):
+def simple_post_dto(post):
     return {
-        **post_common_fields(post, num_likes=num_likes, num_dislikes=num_dislikes, num_comments=num_comments),
-        'announce': clear_html_tags(post.text),
+        **post_common_fields(post),
+        'announce': post_announce(post),
     }
 
 
@@ -264,7 +451,7 @@ def full_post_dto(post):
     }
 
 
-def post_common_fields(post, num_likes=None, num_dislikes=None, num_comments=None):
+def post_common_fields(post):
     return {
         'id': post.id,
         'title': post.title,
@@ -272,10 +459,10 @@ def post_common_fields(post, num_likes=None, num_dislikes=None, num_comments=Non
         # TODO: BUG: Frontend app doesn't consider this field properly while editing a post
         'active': post.is_active,
         'user': user_dto(post.author),
-        'viewCount': post.view_count,
-        'commentCount': num_comments if num_comments else post.comment_count,
-        'likeCount': num_likes if num_likes else post.likes,
-        'dislikeCount': num_dislikes if num_dislikes else post.dislikes,
+        'viewCount': post.view_count + view_counter.pending(post.id),
+        'commentCount': post.comment_count,
+        'likeCount': post.like_count,
+        'dislikeCount': post.dislike_count,
     }
 
 
@@ -285,5 +472,13 @@ def moderated_post_dto(post):
         'time': datetime.strftime(post.time, "%Y-%m-%d %H:%M"),
         'user': user_dto(post.author),
         'title': post.title,
-        'announce': clear_html_tags(post.text)
+        'announce': post_announce(post)
     }
+
+
+def post_announce(post):
+    # Not backfilled yet posts fall back to the text (see `flask backfill-post-announces`)
+    if post.announce is not None:
+        return post.announce
+
+    return make_announce(post.announce_source if post.announce_source is not None else post.text)
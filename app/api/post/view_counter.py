@@ -0,0 +1,87 @@
+import sys
+import threading
+from collections import Counter
+
+from app import app, db
+from app.api.cache import response_cache
+from app.models import Post, Statistics
+from app.worker import BackgroundWorker
+
+
+class ViewCounter:
+    """
+    In-process buffer of post views: increments are accumulated per post id and written by a background
+    thread in one multi-row UPDATE every `VIEW_COUNTER['flush-interval']` seconds, or as soon as
+    `VIEW_COUNTER['flush-size']` views are pending. Pending views are flushed on shutdown as well.
+    Views statistics of the posts' authors are updated in the same transaction, and the flushed posts'
+    cached responses are invalidated afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._total = 0
+        self._worker = BackgroundWorker('view-counter', self.flush, 'Failed to flush post views',
+                                        interval=lambda: app.config['VIEW_COUNTER']['flush-interval'],
+                                        on_exit=self.flush)
+
+    def hit(self, post_id):
+        with self._lock:
+            self._pending[post_id] = self._pending.get(post_id, 0) + 1
+            self._total += 1
+            flush_now = self._total >= app.config['VIEW_COUNTER']['flush-size']
+
+        if flush_now:
+            self._worker.wake()
+        else:
+            self._worker.start()
+
+    def pending(self, post_id):
+        return self._pending.get(post_id, 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending, self._total = self._pending, {}, 0
+
+        if not pending:
+            return 0
+
+        posts, stats = Post.__table__, Statistics.__table__
+
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    posts.update()
+                        .where(posts.c.id.in_(pending.keys()))
+                        .values(view_count=posts.c.view_count + db.case(pending, value=posts.c.id, else_=0))
+                )
+
+                views = Counter({Statistics.BLOG: sum(pending.values())})
+                for post_id, user_id in connection.execute(
+                        db.select([posts.c.id, posts.c.user_id]).where(posts.c.id.in_(pending.keys()))):
+                    views[user_id] += pending[post_id]
+
+                connection.execute(
+                    stats.update()
+                        .where(stats.c.user_id.in_(views.keys()))
+                        .values(views_count=stats.c.views_count + db.case(dict(views), value=stats.c.user_id, else_=0))
+                )
+        except Exception as e:
+            # Keep the views to retry with the next flush
+            with self._lock:
+                for post_id, views in pending.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + views
+                    self._total += views
+            print(f'Failed to flush post views: {e}', file=sys.stderr)
+            return 0
+
+        try:
+            # Cached responses & ETags of the posts carry the view count as of the time they were built
+            response_cache.invalidate('statistics', *(f'post:{post_id}' for post_id in pending))
+        except Exception as e:
+            print(f'Failed to invalidate viewed posts: {e}', file=sys.stderr)
+
+        return sum(pending.values())
+
+
+view_counter = ViewCounter()
@@ -1,47 +1,64 @@
 from flask import Blueprint, abort, request
 
+from app import app
 from app.api.auth.helper import auth_required
+from app.api.cache import response_cache, conditional
 from app.api.helper import response, error_response, check_request
 from app.api.post.helper import (
-    posts_response,
+    paginated_posts_response,
     post_response,
     get_active_posts,
-    paginate,
+    get_full_post,
+    post_version,
+    sort_keys,
     filter_posts,
+    searched_posts_response,
     get_my_posts,
     get_moderated_posts,
     posts_processor,
     moderated_posts_processor,
     process_vote_and_get_response, validate_add_post_request, add_post_error_response, save_post, add_post_response,
     notify_post_added)
+from app.api.post.view_counter import view_counter
 from app.models import Post, User
 
 api_post = Blueprint('api_post', __name__)
 
 
 @api_post.route('/api/post', methods=['GET'])
+@response_cache.cached('posts', 'users')
 def get_posts():
     offset = request.args.get('offset', None, type=int)
     limit = request.args.get('limit', None, type=int)
+    cursor = request.args.get('cursor', None, type=str)
     mode = request.args.get('mode', None, type=str)
 
-    if None in (offset, limit, mode):
+    if None in (limit, mode) or offset is None and cursor is None:
         abort(400, "Wrong request parameters.")
 
-    if mode.lower() not in ['recent', 'popular', 'best', 'early']:
-        abort(400, "Wrong mode. Modes allowed: 'recent', 'popular', 'best', 'early'.")
+    mode = mode.lower()
 
-    posts, posts_total = paginate(offset=offset, limit=limit, items=get_active_posts(mode=mode))
+    if mode not in ['recent', 'popular', 'best', 'early']:
+        abort(400, "Wrong mode. Modes allowed: 'recent', 'popular', 'best', 'early'.")
 
-    return posts_response(processor=posts_processor, items=posts, total=posts_total)
+    return paginated_posts_response(
+        processor=posts_processor,
+        items=get_active_posts(mode=mode),
+        keys=sort_keys(mode),
+        offset=offset,
+        limit=limit,
+        cursor=cursor,
+        count_key=('post',)
+    )
 
 
 @api_post.route('/api/post/<string:request_type>', methods=['GET'])
+@response_cache.cached('posts', 'users')
 def get_filtered_posts(request_type):
     """
     There're 3 request types allowed: /api/post/{search, byDate, byTag}
 
-    Request parameters: `offset`, `limit` & parameter that depends on the request type:
+    Request parameters: `offset` (or `cursor`), `limit` & parameter that depends on the request type:
         `search` > `query`,
         `byDate` > `date`,
         `byTag` > `tag`
@@ -56,23 +73,53 @@ def get_filtered_posts(request_type):
 
     offset = request.args.get('offset', None, type=int)
     limit = request.args.get('limit', None, type=int)
+    cursor = request.args.get('cursor', None, type=str)
     query = request.args.get(query_type, None, type=str)
 
-    if None in (offset, limit, query):
+    if None in (limit, query) or offset is None and cursor is None:
         abort(400, "Wrong request parameters.")
 
-    filtered_posts = filter_posts(query=query.lower(), query_type=query_type, items=get_active_posts())
+    if query_type == 'query' and app.config['SEARCH']['enabled']:
+        return searched_posts_response(
+            processor=posts_processor,
+            query=query,
+            offset=offset,
+            limit=limit,
+            cursor=cursor
+        )
 
-    posts, posts_total = paginate(offset=offset, limit=limit, items=filtered_posts)
+    filtered_posts = filter_posts(query=query.lower(), query_type=query_type, items=get_active_posts())
 
-    return posts_response(processor=posts_processor, items=posts, total=posts_total)
+    return paginated_posts_response(
+        processor=posts_processor,
+        items=filtered_posts,
+        keys=sort_keys(),
+        offset=offset,
+        limit=limit,
+        cursor=cursor,
+        count_key=('post', query_type, query.lower()),
+        estimated=query_type == 'query' and app.config['POSTS_COUNT_CACHE']['estimate-search']
+    )
 
 
 @api_post.route('/api/post/<int:post_id>', methods=['GET'])
 def get_post(post_id):
-    post = Post.query.get_or_404(post_id, f"There's no post with id={post_id}.")
-    post.view_count += 1
-    post.save()
+    rv = full_post_response(post_id=post_id)
+
+    # Views are counted for cached responses as well
+    view_counter.hit(post_id)
+
+    return rv
+
+
+@conditional(post_version)
+@response_cache.cached('post:{post_id}', 'users')
+def full_post_response(post_id):
+    post = get_full_post(post_id)
+
+    if not post:
+        abort(404, f"There's no post with id={post_id}.")
+
     return post_response(post)
 
 
@@ -81,9 +128,10 @@ def get_post(post_id):
 def my_posts(user):
     offset = request.args.get('offset', None, type=int)
     limit = request.args.get('limit', None, type=int)
+    cursor = request.args.get('cursor', None, type=str)
     status = request.args.get('status', None, type=str)
 
-    if None in (offset, limit, status):
+    if None in (limit, status) or offset is None and cursor is None:
         abort(400, "Wrong request parameters.")
 
     status = status.lower()
@@ -91,14 +139,16 @@ def my_posts(user):
     if status not in {'inactive', 'pending', 'declined', 'published'}:
         abort(400, "Wrong status. Statuses allowed: 'inactive', 'pending', 'declined', 'published'.")
 
-    posts, posts_total = paginate(
+    return paginated_posts_response(
+        processor=posts_processor,
+        items=get_my_posts(user, status),
+        keys=sort_keys(),
         offset=offset,
         limit=limit,
-        items=get_my_posts(user, status)
+        cursor=cursor,
+        count_key=('my', user.id, status)
     )
 
-    return posts_response(processor=posts_processor, items=posts, total=posts_total)
-
 
 @api_post.route('/api/post/moderation', methods=['GET'])
 @auth_required
@@ -108,9 +158,10 @@ def moderated_posts(user):
 
     offset = request.args.get('offset', None, type=int)
     limit = request.args.get('limit', None, type=int)
+    cursor = request.args.get('cursor', None, type=str)
     status = request.args.get('status', None, type=str)
 
-    if None in (offset, limit, status):
+    if None in (limit, status) or offset is None and cursor is None:
         abort(400, "Wrong request parameters.")
 
     status = status.lower()
@@ -118,14 +169,16 @@ def moderated_posts(user):
     if status not in {'new', 'declined', 'accepted'}:
         abort(400, "Wrong status. Statuses allowed: 'new', 'declined', 'accepted'.")
 
-    posts, posts_total = paginate(
+    return paginated_posts_response(
+        processor=moderated_posts_processor,
+        items=get_moderated_posts(user, status),
+        keys=sort_keys(),
         offset=offset,
         limit=limit,
-        items=get_moderated_posts(user, status)
+        cursor=cursor,
+        count_key=('moderation', user.id, status)
     )
 
-    return posts_response(processor=moderated_posts_processor, items=posts, total=posts_total)
-
 
 @api_post.route('/api/post/<string:vote_type>', methods=['POST'])
 @auth_required
@@ -1,9 +1,11 @@
 import types
 
-from flask import abort
+from flask import abort, session
 
+from app.api.auth.helper import session_user
+from app.api.cache import response_cache
 from app.api.helper import response, check_request
-from app.api.image.helper import allowed_file, upload_file, remove_file
+from app.api.image.helper import allowed_file, upload_file, remove_file, image_url
 from app.api.validators import is_valid_email, is_registered, validate_password, validate_username
 from app.models import User
 
@@ -54,12 +56,17 @@ def validate_profile_fields(data):
 
 def update_profile(user_id, data):
     user = User.query.get(user_id)
+    payload = None
 
     if data.photo:
         try:
-            user.photo = upload_file(data.photo)
+            derivatives = upload_file(data.photo)
         except OSError as e:
             abort(500, e)
+        if user.photo is not None:
+            remove_file(user.photo)
+        user.photo = image_url(derivatives, 'avatar')
+        payload = {'photo': derivatives}
 
     if data.removePhoto and user.photo is not None:
         remove_file(user.photo)
@@ -75,6 +82,8 @@ def update_profile(user_id, data):
         user.password = data.password
 
     user.save()
+    session['user'] = session_user(user)
+    response_cache.invalidate('users')
 
-    return response(True, 200)
+    return response(True, 200, payload=payload)
 
@@ -41,6 +41,11 @@ def handle_400_error(e):
     return error_response(e)
 
 
+@api_profile.errorhandler(503)
+def handle_503_error(e):
+    return error_response(e)
+
+
 @api_profile.errorhandler(500)
 def handle_500_error(e):
     return error_response(e)
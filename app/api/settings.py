@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+from app import app
+from app.models import Settings
+
+
+class SettingsCache:
+    """
+    In-process copy of global settings: code > raw value ('YES'/'NO').
+
+    The settings are read once per worker and served from memory afterwards. Saving them touches the version
+    file `SETTINGS_CACHE['version-path']`; other workers compare its stat with the one they loaded against,
+    which is a single `stat` call, so reads never go to the database in steady state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = None
+
+    def get(self, code, as_is=False):
+        value = self.all().get(code)
+        return value if as_is else {'YES': True, 'NO': False}.get(value)
+
+    def all(self):
+        version = self._current_version()
+
+        with self._lock:
+            if self._values is not None and version == self._version:
+                return self._values
+
+        values = {option.code: option.value for option in Settings.query.all()}
+
+        with self._lock:
+            self._values, self._version = values, version
+
+        return values
+
+    def version(self):
+        """
+        Version of the saved settings shared by the workers, a validator of responses depending on them
+        """
+        return self._current_version()
+
+    def invalidate(self):
+        """
+        Bumps the shared version, to be called after settings were committed
+        """
+        path = app.config['SETTINGS_CACHE']['version-path']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._values = None
+
+    @staticmethod
+    def _current_version():
+        try:
+            stat = os.stat(app.config['SETTINGS_CACHE']['version-path'])
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+
+settings_cache = SettingsCache()
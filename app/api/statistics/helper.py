@@ -1,17 +1,55 @@
-from flask import jsonify, make_response
+from flask import jsonify, make_response, g
 
-from app.models import Post, Vote
+from app.api.cache import response_cache
+from app.api.settings import settings_cache
+from app.models import Statistics
 
 
 def get_statistics(user=None):
-    user_id = user['id'] if user else None
+    stats = Statistics.get(user['id'] if user else None)
 
     data = {
-        'postsCount': Post.count_by_author(user_id),
-        'likesCount': Vote.count_by_user_and_vote_type(user_id, 'like'),
-        'dislikesCount': Vote.count_by_user_and_vote_type(user_id, 'dislike'),
-        'viewsCount': Post.count_views_by_user(user_id),
-        'firstPublication': Post.get_first_publication_date_by_user(user_id)
+        'postsCount': stats.posts_count,
+        'likesCount': stats.likes_count,
+        'dislikesCount': stats.dislikes_count,
+        'viewsCount': stats.views_count,
+        'firstPublication': stats.first_publication.strftime('%Y-%m-%d %H:%M') if stats.first_publication else None
     }
 
     return make_response(jsonify(data), 200)
+
+
+def statistics_version(stats_type):
+    """
+    Validator inputs of `/api/statistics/*`: the user, the settings (whether statistics is public) and
+    the version of the rollup, which is bumped by post, vote & view writes
+    """
+    return g.user['id'] if g.user else None, settings_cache.version(), response_cache.versions('statistics')
+
+
+def statistics_state(post):
+    return post.author.id, post.time
+
+
+def update_statistics(old_state, post):
+    """
+    Updates the statistics rollup according to the post's author & publication time before & after the change
+    """
+    # Author is set by relation, so `post.user_id` may be not flushed yet
+    user_id = post.author.id
+
+    if old_state is None:
+        Statistics.update_counters(user_id, posts_count=1)
+        Statistics.update_first_publication(user_id, post.time)
+        return
+
+    old_user_id, old_time = old_state
+
+    if old_user_id != user_id:
+        Statistics.invalidate(old_user_id)
+        Statistics.invalidate(user_id)
+    elif post.time < old_time:
+        Statistics.update_first_publication(user_id, post.time)
+    elif post.time > old_time:
+        # The first publication might have been moved later: recomputed on the next read
+        Statistics.invalidate(user_id)
@@ -1,16 +1,18 @@
 from flask import Blueprint, abort, g
 
+from app.api.cache import conditional
 from app.api.helper import response
-from app.api.statistics.helper import get_statistics
-from app.models import Settings
+from app.api.settings import settings_cache
+from app.api.statistics.helper import get_statistics, statistics_version
 
 api_statistics = Blueprint('api_statistics', __name__)
 
 
 @api_statistics.route('/api/statistics/<string:stats_type>', methods=['GET'])
+@conditional(statistics_version)
 def stats(stats_type):
     user = g.user
-    is_stats_public = Settings.get_by_code('STATISTICS_IS_PUBLIC')
+    is_stats_public = settings_cache.get('STATISTICS_IS_PUBLIC')
 
     stats_type = stats_type.lower()
     stats_types = {'my', 'all'}
@@ -0,0 +1,128 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from app import app, db
+from app.models import Post, Tag
+
+
+class TagCloud:
+    """
+    Materialized tag cloud: number of published posts per tag, maintained on post publish, unpublish & retag.
+
+    Scheduled posts wait in a heap until their publication time. Weights and a suffix index of tag names
+    (for the `query` substring filter) are recomputed only after changes, so reads cost no database queries.
+    The cloud is reloaded from the database every `TAG_CLOUD['reload-interval']` seconds to pick up
+    changes made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._posts = {}            # post id > [publication time, tag names, is published]
+        self._counts = Counter()    # tag name > amount of published posts
+        self._scheduled = []        # heap of (publication time, post id)
+        self._weighted = None       # [(tag name, weight), ...]
+        self._suffixes = None       # sorted [(suffix of lowercased tag name, tag name), ...]
+
+    def get_weighted_tags(self, query=None):
+        with self._lock:
+            self._ensure_fresh()
+            self._publish_due()
+
+            if self._weighted is None:
+                self._build()
+
+            if not query:
+                return self._weighted
+
+            matches = self._match(query.lower())
+            return [(name, weight) for name, weight in self._weighted if name in matches]
+
+    def update_post(self, post):
+        """
+        Registers the post's tags if it's accepted & active, forgets them otherwise
+        """
+        if self._loaded_at is None:
+            return
+
+        names = frozenset(tag.name for tag in post.tags)
+        active = post.is_active and post.moderation_status == 'ACCEPTED'
+
+        with self._lock:
+            self._remove(post.id)
+            if active and names:
+                self._add(post.id, post.time, names)
+
+    def _add(self, post_id, publication_time, names):
+        published = publication_time <= datetime.now()
+        self._posts[post_id] = [publication_time, names, published]
+
+        if published:
+            self._counts.update(names)
+            self._weighted = None
+        else:
+            heapq.heappush(self._scheduled, (publication_time, post_id))
+
+    def _remove(self, post_id):
+        entry = self._posts.pop(post_id, None)
+
+        if entry and entry[2]:
+            self._counts.subtract(entry[1])
+            self._counts += Counter()           # drops non-positive counts
+            self._weighted = None
+
+    def _publish_due(self):
+        now = datetime.now()
+
+        while self._scheduled and self._scheduled[0][0] <= now:
+            publication_time, post_id = heapq.heappop(self._scheduled)
+            entry = self._posts.get(post_id)
+            # Skip entries which have been rescheduled or removed since
+            if entry and not entry[2] and entry[0] == publication_time:
+                entry[2] = True
+                self._counts.update(entry[1])
+                self._weighted = None
+
+    def _build(self):
+        tags = sorted(self._counts.items(), key=lambda item: (-item[1], item[0]))
+        most_frequent = tags[0][1] if tags else 1
+
+        self._weighted = [(name, count / most_frequent) for name, count in tags]
+        self._suffixes = sorted((name.lower()[i:], name) for name, _ in tags for i in range(len(name)))
+
+    def _match(self, query):
+        matches = set()
+        start = bisect.bisect_left(self._suffixes, (query,))
+
+        for suffix, name in self._suffixes[start:]:
+            if not suffix.startswith(query):
+                break
+            matches.add(name)
+
+        return matches
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+
+        if self._loaded_at is not None and now - self._loaded_at < app.config['TAG_CLOUD']['reload-interval']:
+            return
+
+        self._posts, self._counts, self._scheduled, self._weighted = {}, Counter(), [], None
+        post_tags = {}
+
+        for post_id, publication_time, name in db.session.query(Post.id, Post.time, Tag.name) \
+                .join(Post.tags) \
+                .filter(Post.is_active, Post.moderation_status == 'ACCEPTED'):
+            post_tags.setdefault(post_id, (publication_time, set()))[1].add(name)
+
+        for post_id, (publication_time, names) in post_tags.items():
+            self._add(post_id, publication_time, frozenset(names))
+
+        self._loaded_at = now
+
+
+tag_cloud = TagCloud()
@@ -3,12 +3,12 @@ from flask import make_response, jsonify
 
 def tags_response(tags):
     return make_response(jsonify({
-        'tags': [tag_dto(tag) for tag, _ in tags]
+        'tags': [tag_dto(name, weight) for name, weight in tags]
     })), 200
 
 
-def tag_dto(tag):
+def tag_dto(name, weight):
     return {
-        'name': tag.name,
-        'weight': tag.weight
+        'name': name,
+        'weight': weight
     }
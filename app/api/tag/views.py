@@ -1,13 +1,16 @@
 from flask import Blueprint, request
 
+from app.api.cache import response_cache, conditional
+from app.api.tag.cloud import tag_cloud
 from app.api.tag.helper import tags_response
-from app.models import Tag
 
 api_tag = Blueprint('api_tag', __name__)
 
 
 @api_tag.route('/api/tag', methods=['GET'])
+@conditional(lambda: response_cache.versions('tags'))
+@response_cache.cached('tags')
 def get_tags():
     query = request.args.get('query', None, type=str)
 
-    return tags_response(Tag.get_weighted_tags(query))
+    return tags_response(tag_cloud.get_weighted_tags(query))
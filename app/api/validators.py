@@ -1,7 +1,8 @@
 import re
 
 from app import app
-from app.models import User, CaptchaCode
+from app.api.auth.captcha.backends import captcha_backend
+from app.models import User
 
 
 def is_valid_email(email: str):
@@ -31,8 +32,7 @@ def validate_password(password, errors):
 
 
 def is_valid_captcha(code, secret):
-    captcha = CaptchaCode.get_by_secret_code(secret)
-    return captcha is not None and captcha.is_valid_code(code)
+    return captcha_backend.verify(code, secret)
 
 
 def validate_captcha(captcha, captcha_secret, errors):
@@ -2,6 +2,7 @@ from flask import Blueprint, make_response, jsonify, abort, request
 
 from app import app
 from app.api.auth.helper import auth_required
+from app.api.cache import response_cache, conditional
 from app.api.helper import (
     error_response,
     check_request,
@@ -10,12 +11,15 @@ from app.api.helper import (
     response,
     save_settings,
     validate_comment_request, comment_error_response, comment_response, notify_comment_added)
-from app.models import Post, Settings, Comment
+from app.api.settings import settings_cache
+from app.models import Post, Comment
+from app.sql_stats import sql_stats
 
 api = Blueprint('api', __name__)
 
 
 @api.route('/api/init', methods=['GET'])
+@response_cache.cached(ttl=3600)
 def get_info():
     return make_response(jsonify(app.config['PROPERTIES']), 200)
 
@@ -41,9 +45,10 @@ def moderate(user):
 
 
 @api.route('/api/settings', methods=['GET'])
+@conditional(lambda: (settings_cache.version(),))
 def get_settings():
     map_value = {"YES": True, "NO": False}
-    settings = {option.code: map_value[option.value] for option in Settings.query.all()}
+    settings = {code: map_value[value] for code, value in settings_cache.all().items()}
     return make_response(jsonify(settings), 200)
 
 
@@ -81,13 +86,26 @@ def add_comment(user):
         text=data.text
     )
 
+    Post.update_counters(data.post_id, comment_count=1)
     comment = comment.save()
+    response_cache.invalidate('posts', f'post:{comment.post_id}')
 
     notify_comment_added(comment)
 
     return comment_response(comment)
 
 
+@api.route('/api/sql/stats', methods=['GET'])
+@auth_required
+def get_sql_stats(user):
+    if not user.is_moderator:
+        abort(403, "You're not allowed to view SQL statistics.")
+
+    top = request.args.get('top', 10, type=int)
+
+    return make_response(jsonify(sql_stats.report(top=max(top, 0))), 200)
+
+
 @api.errorhandler(Exception)
 def handle_400_error(e):
     return error_response(e)
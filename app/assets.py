@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, render_template, request, abort
+
+from app import app
+
+# Compressed copies are kept for text-like assets only, images & fonts are compressed already
+COMPRESSIBLE = {'.js', '.css', '.map', '.svg', '.ico', '.html', '.json', '.txt'}
+
+# Webpack build fingerprint, e.g. `app.1c6d4039.css` or `app.8fb8e253.js.map`
+FINGERPRINT = re.compile(r'\.[0-9a-f]{8}\.\w+(\.map)?$')
+
+
+class Asset:
+    def __init__(self, body, mimetype, immutable=False):
+        self.body = body
+        self.mimetype = mimetype
+        self.immutable = immutable
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.encodings = {}
+
+    def compress(self, config, brotli=None):
+        if len(self.body) < config['min-size']:
+            return
+
+        candidates = {'gzip': gzip.compress(self.body, config['gzip-level'], mtime=0)}
+        if brotli is not None:
+            candidates['br'] = brotli.compress(self.body, quality=config['brotli-quality'])
+
+        # Only the copies worth it
+        self.encodings = {encoding: body for encoding, body in candidates.items() if len(body) < len(self.body) * 0.9}
+
+    def response(self, max_age):
+        encoding = self._choose_encoding()
+        rv = Response(self.encodings[encoding] if encoding else self.body, mimetype=self.mimetype)
+
+        if encoding:
+            rv.content_encoding = encoding
+        if self.encodings:
+            rv.vary.add('Accept-Encoding')
+
+        # Every encoding is a different representation
+        rv.set_etag(f'{self.etag}-{encoding}' if encoding else self.etag)
+        rv.cache_control.public = True
+        rv.cache_control.max_age = max_age
+        if self.immutable:
+            rv.cache_control.immutable = True
+        else:
+            rv.cache_control.no_cache = True
+
+        return rv.make_conditional(request)
+
+    def _choose_encoding(self):
+        accepted = [(request.accept_encodings[encoding], encoding) for encoding in ('br', 'gzip')
+                    if encoding in self.encodings and request.accept_encodings[encoding]]
+        return max(accepted)[1] if accepted else None
+
+
+class StaticAssets:
+    """
+    In-memory index of `STATIC_RESOURCES_DIR` with gzip (& brotli, if installed) copies of text-like assets,
+    built on first use. Fingerprinted assets are cached by browsers for good, the rest are revalidated
+    by their content hash ETag.
+
+    The SPA shell is rendered once per process, i.e. per deploy, and served from memory as well.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._assets = None
+        self._roots = None
+        self._shell = None
+
+    def response(self, path):
+        """
+        :return: response for the static asset, None if the path isn't a static one (404 if it's a missing asset)
+        """
+        assets, roots = self._index()
+        asset = assets.get(path)
+
+        if asset is not None:
+            config = app.config['STATIC_ASSETS']
+            return asset.response(config['max-age'] if asset.immutable else 0)
+
+        if path.split('/', 1)[0] in roots:
+            abort(404)
+
+        return None
+
+    def shell_response(self):
+        if self._shell is None:
+            shell = Asset(render_template('index.html').encode('utf-8'), 'text/html')
+            shell.compress(app.config['STATIC_ASSETS'], load_brotli())
+            self._shell = shell
+
+        return self._shell.response(0)
+
+    def scan(self):
+        root = app.config['STATIC_RESOURCES_DIR']
+        config = app.config['STATIC_ASSETS']
+        brotli = load_brotli()
+        assets = {}
+
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                full_path = os.path.join(dir_path, file_name)
+                path = os.path.relpath(full_path, root).replace(os.sep, '/')
+
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+
+                mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+                asset = Asset(body, mimetype, immutable=FINGERPRINT.search(file_name) is not None)
+
+                if os.path.splitext(file_name)[1].lower() in COMPRESSIBLE:
+                    asset.compress(config, brotli)
+
+                assets[path] = asset
+
+        with self._lock:
+            # Roots first: the assets being set marks the index as built for lock-free readers
+            self._roots = {path.split('/', 1)[0] for path in assets}
+            self._assets = assets
+
+        return len(assets)
+
+    def _index(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self.scan()
+
+        return self._assets, self._roots
+
+
+def load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+static_assets = StaticAssets()
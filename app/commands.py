@@ -0,0 +1,166 @@
+import timeit
+from datetime import datetime
+
+import click
+
+from app import app, db
+from app.api.post.helper import make_announce, filter_posts, get_active_posts
+from app.models import Post, Vote, Comment, PostCalendar, Statistics, OutboxMail
+from app.outbox import mail_outbox
+from app.search.index import search_index
+
+
+@app.cli.command('recount-post-counters')
+@click.option('--batch-size', default=500, show_default=True, help='Amount of posts processed per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not fix it.')
+def recount_post_counters(batch_size, dry_run):
+    """
+    Recomputes denormalized like/dislike/comment counters of posts in batches and reports drift.
+    """
+    last_id, checked, drifted = 0, 0, 0
+
+    while True:
+        posts = Post.query.with_entities(Post.id, Post.like_count, Post.dislike_count, Post.comment_count) \
+            .filter(Post.id > last_id) \
+            .order_by(Post.id) \
+            .limit(batch_size) \
+            .all()
+
+        if not posts:
+            break
+
+        ids = [post.id for post in posts]
+        last_id = ids[-1]
+
+        votes = dict(
+            ((post_id, value), cnt) for post_id, value, cnt in
+            Vote.query.with_entities(Vote.post_id, Vote.value, db.func.count(Vote.id))
+                .filter(Vote.post_id.in_(ids))
+                .group_by(Vote.post_id, Vote.value)
+        )
+
+        comments = dict(
+            Comment.query.with_entities(Comment.post_id, db.func.count(Comment.id))
+                .filter(Comment.post_id.in_(ids))
+                .group_by(Comment.post_id)
+        )
+
+        for post in posts:
+            actual = {
+                'like_count': votes.get((post.id, 1), 0),
+                'dislike_count': votes.get((post.id, -1), 0),
+                'comment_count': comments.get(post.id, 0),
+            }
+            drift = {counter: value - getattr(post, counter)
+                     for counter, value in actual.items() if value != getattr(post, counter)}
+
+            if drift:
+                drifted += 1
+                click.echo(f"Post id={post.id}: drift {drift}")
+                if not dry_run:
+                    Post.query.filter(Post.id == post.id).update(actual, synchronize_session=False)
+
+        checked += len(posts)
+        db.session.commit()
+
+    click.echo(f"Checked {checked} post(s), {drifted} with drifted counters{' (not fixed)' if dry_run else ''}.")
+
+
+@app.cli.command('backfill-post-announces')
+@click.option('--batch-size', default=100, show_default=True, help='Amount of posts processed per transaction.')
+@click.option('--all', 'rebuild_all', is_flag=True, help='Rebuild announces of all posts, e.g. after length change.')
+def backfill_post_announces(batch_size, rebuild_all):
+    """
+    Computes plain-text announces of posts which don't have one yet.
+    """
+    last_id, updated = 0, 0
+    f = () if rebuild_all else (Post.announce.is_(None),)
+
+    while True:
+        posts = Post.query.with_entities(Post.id, Post.text) \
+            .filter(Post.id > last_id, *f) \
+            .order_by(Post.id) \
+            .limit(batch_size) \
+            .all()
+
+        if not posts:
+            break
+
+        last_id = posts[-1].id
+
+        for post in posts:
+            Post.query.filter(Post.id == post.id).update({'announce': make_announce(post.text)},
+                                                         synchronize_session=False)
+
+        updated += len(posts)
+        db.session.commit()
+
+    click.echo(f"Updated announces of {updated} post(s).")
+
+
+@app.cli.command('build-search-index')
+def build_search_index():
+    """
+    Rebuilds the full-text search index of accepted active posts from scratch.
+    """
+    click.echo(f"Indexed {search_index.rebuild()} post(s) to {app.config['SEARCH']['index-path']}.")
+
+
+@app.cli.command('benchmark-search')
+@click.argument('queries', nargs=-1, required=True)
+@click.option('--repeat', default=20, show_default=True, help='Runs per query & search path.')
+@click.option('--limit', default=10, show_default=True, help='Page size.')
+def benchmark_search(queries, repeat, limit):
+    """
+    Compares the search index with `LIKE` path: a page of posts plus the total per run.
+    """
+    def like_path(query):
+        items = filter_posts(query=query.lower(), query_type='query', items=get_active_posts())
+        return items.limit(limit).all(), items.order_by(None).count()
+
+    def index_path(query):
+        results = search_index.search(query)
+        ids = [post_id for _, post_id in results[:limit]]
+        return get_active_posts().filter(Post.id.in_(ids)).all() if ids else [], len(results)
+
+    search_index.search(queries[0])                                 # load the index beforehand
+
+    for query in queries:
+        for name, path in (('LIKE', like_path), ('index', index_path)):
+            _, total = path(query)
+            elapsed = timeit.timeit(lambda: path(query), number=repeat) / repeat
+            click.echo(f"{query!r:24} {name:6} total={total:<6} {elapsed * 1000:8.2f} ms/run")
+
+
+@app.cli.command('rebuild-post-calendar')
+def rebuild_post_calendar():
+    """
+    Recomputes the daily rollup of accepted active posts used by /api/calendar.
+    """
+    click.echo(f"Rebuilt post calendar: {PostCalendar.rebuild()} day(s).")
+
+
+@app.cli.command('reset-statistics')
+def reset_statistics():
+    """
+    Drops statistics rollup, every row is recomputed by one aggregated query on its next read.
+    """
+    deleted = Statistics.query.delete()
+    db.session.commit()
+    click.echo(f"Reset statistics of {deleted} scope(s).")
+
+
+@app.cli.command('deliver-mail')
+@click.option('--retry-failed', is_flag=True, help='Retry messages that are out of attempts as well.')
+def deliver_mail(retry_failed):
+    """
+    Sends the due messages of the mail outbox now.
+    """
+    if retry_failed:
+        retried = OutboxMail.query.filter(OutboxMail.attempts >= app.config['MAIL_OUTBOX']['attempts']) \
+            .update({OutboxMail.attempts: 0, OutboxMail.next_attempt: datetime.now()}, synchronize_session=False)
+        db.session.commit()
+        click.echo(f"Retrying {retried} failed message(s).")
+
+    click.echo(f"Sent {mail_outbox.deliver()} message(s), "
+               f"{OutboxMail.query.count()} left in the outbox.")
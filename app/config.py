@@ -11,11 +11,16 @@ class BaseConfig:
     DEBUG = False
     STATIC_RESOURCES_DIR = os.path.join(base_dir, 'resources', 'static')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = bool(os.getenv('SQLALCHEMY_ECHO'))    # every statement to stdout, see SQL_STATS instead
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv('SECRET_KEY')
     PERMANENT_SESSION_LIFETIME = timedelta(days=5)
-    BCRYPT_LOG_ROUNDS = 8
+    BCRYPT_LOG_ROUNDS = 8                                   # stored hashes are upgraded on successful login
+    PASSWORD_HASHING = {
+        "workers": 2,               # processes, 0 to hash in the request thread
+        "queue-size": 8,            # jobs waiting for a process, any job over it fails with 503
+        "timeout": 5                # seconds
+    }
 
     # Mail Client Settings
     MAIL_SERVER = os.getenv('MAIL_SERVER')
@@ -24,15 +29,62 @@ class BaseConfig:
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_DEFAULT_SENDER = MAIL_USERNAME
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_OUTBOX = {
+        "batch-size": 20,           # messages sent over one SMTP connection
+        "attempts": 5,              # the message stays in the outbox with its last error after these
+        "backoff": 60,              # seconds before the first retry, doubled then
+        "poll-interval": 30         # seconds, picks up retries & mail queued by other workers
+    }
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024                    # 5 megabytes
+    IMAGES = {
+        "derivatives": {            # max widths, px
+            "avatar": 96,
+            "thumbnail": 240,
+            "content": 1024
+        },
+        "webp": True,               # WebP copy of every derivative
+        "quality": 85,              # JPEG & WebP
+        "max-pixels": 40 * 1000 * 1000,
+        "workers": 2,               # processes, 0 to process images in the request thread
+        "queue-size": 4,
+        "timeout": 30               # seconds
+    }
+    STATIC_ASSETS = {
+        "max-age": 365 * 24 * 3600,     # seconds, fingerprinted assets, e.g. app.1c6d4039.css
+        "min-size": 1024,               # bytes, smaller assets aren't compressed
+        "gzip-level": 9,
+        "brotli-quality": 11            # if brotli is installed
+    }
+    UPLOADS = {
+        "offload": os.getenv('UPLOADS_OFFLOAD'),      # x-accel-redirect (nginx), x-sendfile (apache, lighttpd)
+        "internal-prefix": os.getenv('UPLOADS_INTERNAL_PREFIX', '/internal/upload/'),  # nginx internal location
+        "max-age": 365 * 24 * 3600,                 # seconds, content-addressed files
+        "legacy-max-age": 3600                      # seconds, files uploaded before
+    }
+    STORAGE = {
+        "backend": os.getenv('STORAGE_BACKEND', 'local'),           # local (UPLOAD_DIR), s3
+        "url": os.getenv('STORAGE_URL'),                            # S3 endpoint, e.g. http://localhost:9000
+        "bucket": os.getenv('STORAGE_BUCKET'),
+        "public-url": os.getenv('STORAGE_PUBLIC_URL'),              # base URL the bucket's files are served at
+        "tmp-dir": os.path.join(os.path.dirname(base_dir), 'var', 'tmp'),
+        "chunk-size": 64 * 1024
+    }
 
     # Telegram Client Settings
     TELEGRAM = {
         'enabled': os.getenv('TELEGRAM_ENABLED'),
         'proxy-url': os.getenv('TELEGRAM_PROXY_URL'),
         'proxy-jwt-token': os.getenv('TELEGRAM_PROXY_JWT_AUTH_TOKEN'),
-        'timeout': (60, 60)                                 # Connection, Read
+        'timeout': (5, 15),                                 # Connection, Read
+        'workers': 1,                                       # delivering threads per process
+        'queue-size': 1000,                                 # messages, any message over it is dropped
+        'digest-window': 2,                                 # seconds to collect messages into one digest
+        'digest-size': 20,                                  # messages per digest at most
+        'retries': 3,
+        'backoff': 1,                                       # seconds before the first retry, doubled then
+        'breaker-threshold': 5,                             # consecutive failures to suspend deliveries
+        'breaker-timeout': 60                               # seconds deliveries are suspended for
     }
 
     # Various App Properties & Configs
@@ -48,12 +100,70 @@ class BaseConfig:
     CAPTCHA = {
         "length": 6,        # chars
         "ttl": 1,           # hours
-        "font-size": 18
+        "font-size": 18,
+        "backend": os.getenv('CAPTCHA_BACKEND', 'database'),     # database, signed (no DB writes)
+        "pool-size": 50,            # pre-rendered captchas per worker
+        "sweep-interval": 600       # seconds between deletions of outdated captchas (replay records)
+    }
+
+    ANNOUNCE = {
+        "length": 500       # chars
+    }
+
+    RESPONSE_CACHE = {
+        "enabled": True,
+        "backend": os.getenv('RESPONSE_CACHE_BACKEND', 'memory'),    # memory, redis
+        "url": os.getenv('RESPONSE_CACHE_URL'),                      # redis://localhost:6379/0
+        "max-entries": 1024,
+        "ttl": 60                   # seconds
+    }
+
+    VIEW_COUNTER = {
+        "flush-interval": 10,       # seconds
+        "flush-size": 500           # pending views
+    }
+
+    SQL_STATS = {
+        "enabled": True,
+        "header": bool(os.getenv('SQL_STATS_HEADER')),      # X-SQL-Stats response header with the request's totals
+        "slow-threshold": 0.1,      # seconds
+        "slow-sample-rate": 0.5,    # share of slow statements written to the log
+        "slow-log-path": os.getenv('SQL_SLOW_LOG_PATH',
+                                   os.path.join(os.path.dirname(base_dir), 'var', 'slow-queries.log')),
+        "max-fingerprints": 200     # per endpoint, the rest are accounted as <other>
+    }
+
+    SEARCH = {
+        "enabled": True,
+        "index-path": os.getenv('SEARCH_INDEX_PATH',
+                                os.path.join(os.path.dirname(base_dir), 'var', 'search-index.json.gz')),
+        "title-boost": 3,
+        "reload-interval": 5,       # seconds between checks for changes indexed by another worker
+        "compact-size": 1024 * 1024     # bytes of the journal folded into a new snapshot
+    }
+
+    TAG_CLOUD = {
+        "reload-interval": 300      # seconds, picks up changes made by other workers
+    }
+
+    POSTS_COUNT_CACHE = {
+        "ttl": 300,                 # seconds
+        "estimate-search": True     # don't count full-text search results, estimate them by the current page
+    }
+
+    SETTINGS_CACHE = {
+        "version-path": os.getenv('SETTINGS_VERSION_PATH',
+                                  os.path.join(os.path.dirname(base_dir), 'var', 'settings.version'))
+    }
+
+    MODERATION_QUEUE = {
+        "ttl": 30                   # seconds, picks up posts saved & moderated by other workers
     }
 
     USERNAME = {"min": 3, "max": 255}
     PASSWORD = {"min": 6, "max": 255}
     TITLE = {'min': 5, 'max': 255}
+    TAG = {'max': 255}
     TEXT = {'min': 10, 'max': 5000}
 
 
@@ -62,6 +172,7 @@ class DevelopmentConfig(BaseConfig):
     Development application configuration
     """
     DEBUG = True
+    SQL_STATS = dict(BaseConfig.SQL_STATS, header=True)
 
 
 class ProductionConfig(BaseConfig):
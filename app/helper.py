@@ -1,8 +1,11 @@
 import os
+import re
 import string
 import random
+from html.parser import HTMLParser
 
-from bs4 import BeautifulSoup
+VISIBLE = re.compile(r'\S')
+FEED_SIZE = 4096                # chars of markup fed to the tag stripper at once
 
 
 def create_upload_dir(upload_dir):
@@ -15,5 +18,64 @@ def generate_random_string(length=2):
     return ''.join(random.choice(symbols) for _ in range(length))
 
 
-def clear_html_tags(text):
-    return BeautifulSoup(text, features="html.parser").get_text()
\ No newline at end of file
+class TagStripper(HTMLParser):
+    """
+    Streaming HTML tag stripper: collects text data only, entities are converted.
+    Stops parsing as soon as more than `max_length` characters are collected: text over the limit isn't copied,
+    only the next visible character is kept to tell the text goes on.
+    """
+
+    class Enough(Exception):
+        pass
+
+    def __init__(self, max_length=None):
+        super(TagStripper, self).__init__(convert_charrefs=True)
+        self.max_length = max_length
+        self.chunks = []
+        self.length = 0
+
+    def handle_data(self, data):
+        if not self.length:
+            data = data.lstrip()
+
+        if self.max_length is None or self.length + len(data) <= self.max_length:
+            self._append(data)
+            return
+
+        budget = max(self.max_length - self.length, 0)
+        visible = VISIBLE.search(data, budget)
+
+        if visible is None:
+            # Whitespace only over the limit so far, a single one keeps the words apart
+            if self.length <= self.max_length:
+                self._append(data[:budget + 1])
+            return
+
+        self._append(data[:budget] + (' ' if visible.start() > budget else '') + visible.group())
+        raise TagStripper.Enough
+
+    def _append(self, data):
+        self.chunks.append(data)
+        self.length += len(data)
+
+    def get_text(self):
+        return ''.join(self.chunks)
+
+
+def clear_html_tags(text, max_length=None):
+    """
+    Returns plain text of HTML markup. If `max_length` is set, the result is only guaranteed
+    to be complete up to `max_length` characters.
+    """
+    stripper = TagStripper(max_length)
+    # With a limit the markup is fed in pieces, so a long text node is never decoded as a whole
+    step = len(text) if max_length is None else max(max_length * 2, FEED_SIZE)
+
+    try:
+        for start in range(0, len(text), step or 1):
+            stripper.feed(text[start:start + step])
+        stripper.close()
+    except TagStripper.Enough:
+        pass
+
+    return stripper.get_text()
\ No newline at end of file
@@ -1,9 +1,12 @@
 import uuid
 from datetime import datetime, timedelta
 
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
 
-from app import db, app, bcrypt
+from app import db
+from app.api.auth.passwords import password_hasher
 from app.api.auth.captcha.helper import generate_captcha_code, generate_base64_image
 
 
@@ -36,10 +39,13 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self._password = bcrypt.generate_password_hash(password, app.config['BCRYPT_LOG_ROUNDS']).decode('utf-8')
+        self._password = password_hasher.hash(password)
 
     def is_valid_password(self, password):
-        return bcrypt.check_password_hash(self._password, password)
+        return password_hasher.check(self._password, password)
+
+    def needs_rehash(self):
+        return password_hasher.needs_rehash(self._password)
 
     def save(self):
         db.session.add(self)
@@ -83,11 +89,20 @@ class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(255), nullable=False)
     text = db.Column(db.Text, nullable=False)
+    announce = db.Column(db.Text, nullable=True)
+    announce_source = db.query_expression()                     # text of posts without announce, in lists
     is_active = db.Column(db.Boolean, nullable=False)
     time = db.Column(db.DateTime, nullable=False, default=datetime.now())
     moderation_status = db.Column(db.String(10), nullable=False)
     view_count = db.Column(db.Integer, nullable=False, default=0)
 
+    """
+    Denormalized counters: maintained along with votes & comments writes
+    """
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    dislike_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+
     """
     Relations
     """
@@ -98,7 +113,7 @@ class Post(db.Model):
     comments = db.relationship('Comment', backref='post', lazy=True, foreign_keys="Comment.post_id")
     tags = db.relationship('Tag', secondary=post_tags,
                            backref=db.backref('posts', lazy='dynamic'),
-                           lazy='dynamic')
+                           lazy=True)
 
     def __init__(self, *args, **kwargs):
         super(Post, self).__init__(*args, **kwargs)
@@ -118,18 +133,6 @@ class Post(db.Model):
     Hybrid properties
     """
 
-    @hybrid_property
-    def comment_count(self):
-        return len(self.comments)
-
-    @hybrid_property
-    def likes(self):
-        return sum(1 for vote in self.votes if vote.value == 1)
-
-    @hybrid_property
-    def dislikes(self):
-        return sum(1 for vote in self.votes if vote.value == -1)
-
     @hybrid_property
     def active_posts(self):
         return self.query.filter(*Post.active_posts_filter())
@@ -139,23 +142,50 @@ class Post(db.Model):
         return Post.is_active, Post.moderation_status == 'ACCEPTED', Post.time <= datetime.now()
 
     @staticmethod
-    def count_by_author(user_id=None):
-        f = (Post.user_id is not None, ) if not user_id else (Post.user_id == user_id, )
-        return Post.query.filter(*f).count()
+    def update_counters(post_id, **deltas):
+        """
+        Atomically shifts denormalized counters, e.g. `Post.update_counters(1, like_count=1, dislike_count=-1)`.
+        Only issues an UPDATE within the current transaction: it's up to the caller to commit.
+        """
+        values = {getattr(Post, counter): getattr(Post, counter) + delta for counter, delta in deltas.items() if delta}
+
+        if values:
+            Post.query.filter(Post.id == post_id).update(values, synchronize_session=False)
+
+    def __repr__(self):
+        return f"<Post(id='{self.id}', title='{self.title[:25]}...', is_active={self.is_active}, " \
+               f"moderation_status='{self.moderation_status}', view_count='{self.view_count}', time='{self.time}')>"
+
+
+class PostCalendar(db.Model):
+    """
+    Daily rollup: amount of accepted active posts per publication date, scheduled ones included
+    """
+    __tablename__ = "post_calendar"
+
+    date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
 
     @staticmethod
-    def count_views_by_user(user_id=None):
-        f = (Post.user_id is not None,) if not user_id else (Post.user_id == user_id,)
-        return int(Post.query.filter(*f).value(db.func.sum(Post.view_count)))
+    def shift(date, delta):
+        """
+        Upserts the day's counter within the current transaction: it's up to the caller to commit
+        """
+        statement = mysql_insert(PostCalendar.__table__).values(date=date, count=delta)
+        db.session.execute(statement.on_duplicate_key_update(count=statement.table.c.count + delta))
 
     @staticmethod
-    def get_first_publication_date_by_user(user_id):
-        f = (Post.user_id is not None,) if not user_id else (Post.user_id == user_id,)
-        return Post.query.filter(*f).value(db.func.date_format(db.func.min(Post.time), '%Y-%m-%d %H:%m'))
+    def rebuild():
+        PostCalendar.query.delete()
+        days = db.session.query(db.func.date(Post.time).label('date'), db.func.count('*').label('count')) \
+            .filter(Post.is_active, Post.moderation_status == 'ACCEPTED') \
+            .group_by('date')
+        db.session.execute(PostCalendar.__table__.insert().from_select(['date', 'count'], days))
+        db.session.commit()
+        return PostCalendar.query.count()
 
     def __repr__(self):
-        return f"<Post(id='{self.id}', title='{self.title[:25]}...', is_active={self.is_active}, " \
-               f"moderation_status='{self.moderation_status}', view_count='{self.view_count}', time='{self.time}')>"
+        return f"<PostCalendar(date='{self.date}', count={self.count})>"
 
 
 class Tag(db.Model):
@@ -166,8 +196,6 @@ class Tag(db.Model):
 
     def __init__(self, name):
         self.name = name
-        self.base_weight = 0.0
-        self.weight = 0.0
 
     def save(self):
         db.session.add(self)
@@ -201,23 +229,58 @@ class Tag(db.Model):
             .order_by(db.desc('cnt'), db.asc(Tag.name))
 
     @staticmethod
-    def get_weighted_tags(query=None):
-        active_tags = Tag.active_tags.all()
-        most_frequent_tag, _ = Tag.active_tags.first()
-
-        for tag, posts_tagged in active_tags:
-            tag.base_weight = posts_tagged / Post.active_posts.count()
+    def normalize_names(names):
+        """
+        Strips names & drops blank and case-insensitive duplicates, the first spelling wins
+        """
+        normalized = {}
 
-        for tag, _ in active_tags:
-            tag.weight = tag.base_weight / most_frequent_tag.base_weight
+        for name in (name.strip() for name in names):
+            if name and name.lower() not in normalized:
+                normalized[name.lower()] = name
 
-        return active_tags if not query else list(
-            filter(lambda item: query.lower() in item[0].name.lower(), active_tags))
+        return list(normalized.values())
 
     @staticmethod
-    def save_tag(name):
-        tag = Tag.query.filter(db.func.lower(Tag.name) == name.lower()).first()
-        return tag if tag else Tag(name).save()
+    def resolve_tags(names):
+        """
+        Returns tags for the given names: existing tags are fetched by one `IN` query (`idx_tags_name`), missing
+        ones are inserted by one multi-row `INSERT IGNORE` and fetched by a locking read, which sees the tags
+        committed meanwhile by concurrent requests unlike the transaction's snapshot. Names are matched by
+        the database, so names the collation considers equal to a tag of another spelling (case, accent
+        variants) resolve to that tag. Names are expected to be validated against the column length.
+        Doesn't commit: tags are saved along with the post.
+        """
+        names = Tag.normalize_names(names)
+
+        if not names:
+            return []
+
+        def fetch(tag_names, lock=False):
+            # Every name is compared by the database within the same query: {name: tag}
+            query = db.session.query(Tag, *(Tag.name == name for name in tag_names)).filter(Tag.name.in_(tag_names))
+            if lock:
+                query = query.with_for_update(read=True)
+
+            return {name: tag for tag, *matches in query for name, match in zip(tag_names, matches) if match}
+
+        tags = fetch(names)
+        missing = [name for name in names if name not in tags]
+
+        if missing:
+            db.session.execute(
+                Tag.__table__.insert()
+                    .prefix_with('IGNORE')
+                    .values([{'name': name} for name in missing])
+            )
+            tags.update(fetch(missing, lock=True))
+
+        # Different names may be the same tag for the collation
+        resolved = {}
+        for name in names:
+            resolved.setdefault(tags[name].id, tags[name])
+
+        return list(resolved.values())
 
     def __new__(cls, *args, **kwargs):
         return super(Tag, cls).__new__(cls)
@@ -296,45 +359,125 @@ class Vote(db.Model):
         db.session.commit()
 
     @staticmethod
-    def get_by_post_and_user(post_id, user_id):
-        return Vote.query.filter_by(post_id=post_id, user_id=user_id).first()
+    def counter_name(value):
+        return {1: 'like_count', -1: 'dislike_count'}[value]
 
     @staticmethod
-    def count_by_user_and_vote_type(user_id, vote_type='like'):
-        vote_types = {'like': 1, 'dislike': -1}
-        filter_criteria = (Vote.user_id is not None,) if not user_id else (Vote.user_id == user_id,)
-        return Vote.query.filter(Vote.value == vote_types[vote_type], *filter_criteria).count()
+    def get_by_post_and_user(post_id, user_id):
+        return Vote.query.filter_by(post_id=post_id, user_id=user_id).first()
 
     def __repr__(self):
         return f"<Vote(id={self.id}, post_id={self.post_id}, user_id={self.user_id}, value='{self.value}', " \
                f"time='{self.time}')>"
 
 
+class Statistics(db.Model):
+    """
+    Statistics rollup per user (by `user_id`) and for the whole blog (`user_id = 0`).
+
+    Rows are kept up to date by post, vote & view writes. A missing row is computed by one aggregated
+    statement on the first read, so deleting rows is the way to have them recomputed.
+    """
+    __tablename__ = "statistics"
+
+    BLOG = 0
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    posts_count = db.Column(db.Integer, nullable=False, default=0)
+    likes_count = db.Column(db.Integer, nullable=False, default=0)
+    dislikes_count = db.Column(db.Integer, nullable=False, default=0)
+    views_count = db.Column(db.Integer, nullable=False, default=0)
+    first_publication = db.Column(db.DateTime, nullable=True)
+
+    @staticmethod
+    def get(user_id=None):
+        scope = user_id or Statistics.BLOG
+        stats = Statistics.query.get(scope)
+
+        if stats is None:
+            stats = Statistics.compute(scope)
+            db.session.add(stats)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Computed concurrently by another request
+                db.session.rollback()
+                stats = Statistics.query.get(scope)
+
+        return stats
+
+    @staticmethod
+    def compute(user_id):
+        posts_filter = (Post.user_id == user_id,) if user_id else ()
+        votes_filter = (Vote.user_id == user_id,) if user_id else ()
+
+        def count_votes(value):
+            return db.session.query(db.func.count(Vote.id)).filter(Vote.value == value, *votes_filter).as_scalar()
+
+        posts_count, likes_count, dislikes_count, views_count, first_publication = db.session.query(
+            db.session.query(db.func.count(Post.id)).filter(*posts_filter).as_scalar(),
+            count_votes(1),
+            count_votes(-1),
+            db.session.query(db.func.coalesce(db.func.sum(Post.view_count), 0)).filter(*posts_filter).as_scalar(),
+            db.session.query(db.func.min(Post.time)).filter(*posts_filter).as_scalar()
+        ).one()
+
+        return Statistics(user_id=user_id, posts_count=posts_count, likes_count=likes_count,
+                          dislikes_count=dislikes_count, views_count=int(views_count),
+                          first_publication=first_publication)
+
+    @staticmethod
+    def update_counters(user_id, **deltas):
+        """
+        Shifts counters of the user & of the blog within the current transaction: it's up to the caller to commit
+        """
+        values = {getattr(Statistics, counter): getattr(Statistics, counter) + delta
+                  for counter, delta in deltas.items() if delta}
+
+        if values:
+            Statistics.query.filter(Statistics.user_id.in_((user_id, Statistics.BLOG))) \
+                .update(values, synchronize_session=False)
+
+    @staticmethod
+    def update_first_publication(user_id, time):
+        Statistics.query.filter(Statistics.user_id.in_((user_id, Statistics.BLOG))).update({
+            Statistics.first_publication: db.case(
+                [(db.or_(Statistics.first_publication.is_(None), Statistics.first_publication > time), time)],
+                else_=Statistics.first_publication)
+        }, synchronize_session=False)
+
+    @staticmethod
+    def invalidate(user_id):
+        Statistics.query.filter(Statistics.user_id.in_((user_id, Statistics.BLOG))).delete(synchronize_session=False)
+
+    @staticmethod
+    def counter_name(vote_value):
+        return {1: 'likes_count', -1: 'dislikes_count'}[vote_value]
+
+    def __repr__(self):
+        return f"<Statistics(user_id={self.user_id}, posts_count={self.posts_count}, likes_count={self.likes_count}, " \
+               f"dislikes_count={self.dislikes_count}, views_count={self.views_count})>"
+
+
 class CaptchaCode(db.Model):
     __tablename__ = "captcha_codes"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     code = db.Column(db.String(255), nullable=False)
     secret_code = db.Column(db.String(255), unique=True, nullable=False)
-    time = db.Column(db.DateTime, nullable=False, default=datetime.now())
+    time = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, code=None, image=None, *args, **kwargs):
         super(CaptchaCode, self).__init__(*args, **kwargs)
-        self.code = generate_captcha_code()
+        self.code = code or generate_captcha_code()
         self.secret_code = str(uuid.uuid4())
-        self.image_base_64 = generate_base64_image(self.code)
+        self.image_base_64 = image or generate_base64_image(self.code)
 
     def save(self):
         db.session.add(self)
 
-        # At this point, the object has been pushed to the DB,
-        # and has been automatically assigned a unique PK id
-        db.session.flush()
         db.session.commit()
 
-        # Updates given object in the session with its state in the DB
-        db.session.refresh(self)
-
         return self
 
     def delete(self):
@@ -355,16 +498,87 @@ class CaptchaCode(db.Model):
 
         return CaptchaCode.query.filter(CaptchaCode.time <= time).delete()
 
-    def json(self):
-        return {
-            'secret': self.secret_code,
-            'image': self.image_base_64
-        }
-
     def __repr__(self):
         return f"<CaptchaCode(id='{self.id}', code='{self.code}', reg_time='{self.time}')>"
 
 
+class Upload(db.Model):
+    """
+    Stored image identified by the SHA-256 of the uploaded bytes, shared by everyone who uploaded the same file
+    """
+    __tablename__ = "uploads"
+
+    hash = db.Column(db.String(64), primary_key=True)
+    refs = db.Column(db.Integer, nullable=False, default=1)
+    files = db.Column(db.Text, nullable=False)                  # JSON: {derivative: {ext: storage key}}
+    time = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    @staticmethod
+    def acquire(content_hash):
+        """
+        Adds a reference to the stored upload, returns it or None if there's no such upload
+        """
+        updated = Upload.query.filter(Upload.hash == content_hash) \
+            .update({Upload.refs: Upload.refs + 1}, synchronize_session=False)
+        return Upload.query.populate_existing().get(content_hash) if updated else None
+
+    @staticmethod
+    def release(content_hash):
+        """
+        Drops a reference, returns the upload if it was the last one and the row is deleted
+        """
+        Upload.query.filter(Upload.hash == content_hash, Upload.refs > 0) \
+            .update({Upload.refs: Upload.refs - 1}, synchronize_session=False)
+        upload = Upload.query.populate_existing().get(content_hash)
+
+        if upload is None or upload.refs > 0:
+            return None
+
+        deleted = Upload.query.filter(Upload.hash == content_hash, Upload.refs == 0).delete(synchronize_session=False)
+        return upload if deleted else None
+
+    def __repr__(self):
+        return f"<Upload(hash='{self.hash}', refs={self.refs}, time='{self.time}')>"
+
+
+class OutboxMail(db.Model):
+    """
+    Mail waiting for delivery, stored in the same transaction as the changes it's about
+    """
+    __tablename__ = "mail_outbox"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt = db.Column(db.DateTime, nullable=False, index=True, default=datetime.now)
+    error = db.Column(db.Text, nullable=True)                   # of the last failed attempt
+    time = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    @staticmethod
+    def get_due(max_attempts, limit):
+        return OutboxMail.query \
+            .filter(OutboxMail.next_attempt <= datetime.now(), OutboxMail.attempts < max_attempts) \
+            .order_by(OutboxMail.id) \
+            .limit(limit) \
+            .all()
+
+    @staticmethod
+    def claim(mail_id, attempts, retry_at):
+        """
+        Counts the attempt & schedules the next one, unless another worker has claimed the mail already.
+        Returns True if the mail is claimed.
+        """
+        return OutboxMail.query.filter(OutboxMail.id == mail_id, OutboxMail.attempts == attempts) \
+            .update({OutboxMail.attempts: attempts + 1, OutboxMail.next_attempt: retry_at},
+                    synchronize_session=False) == 1
+
+    def __repr__(self):
+        return f"<OutboxMail(id={self.id}, recipient='{self.recipient}', attempts={self.attempts}, " \
+               f"next_attempt='{self.next_attempt}')>"
+
+
 class Settings(db.Model):
     __tablename__ = "global_settings"
 
@@ -384,10 +598,5 @@ class Settings(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    @staticmethod
-    def get_by_code(code, as_is=False):
-        option = Settings.query.filter_by(code=code).first().value
-        return option if as_is else {'YES': True, 'NO': False}.get(option)
-
     def __repr__(self):
         return f"<Setting(id='{self.id}', code='{self.code}', name='{self.name}', value='{self.value}'>"
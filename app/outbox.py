@@ -0,0 +1,117 @@
+import sys
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+from app import app, db, mail
+from app.models import OutboxMail
+from app.worker import BackgroundWorker
+
+
+class MailOutbox:
+    """
+    Persistent outbox of the app's mail. Messages are added to the current DB session, so they're stored
+    by the same commit as the changes they're about, and sent by a background thread: due messages are
+    claimed in batches of `MAIL_OUTBOX['batch-size']` and sent over a single SMTP connection per batch.
+
+    Every attempt schedules the next one with exponential backoff before sending, so the messages of a failed
+    batch or a crashed process are retried later, up to `MAIL_OUTBOX['attempts']` times. The outbox is shared
+    by the workers of every process, each message is claimed by one of them.
+    """
+
+    def __init__(self):
+        self._worker = BackgroundWorker('mail-outbox', self.deliver, 'Failed to deliver mail',
+                                        interval=lambda: app.config['MAIL_OUTBOX']['poll-interval'])
+
+    def put(self, recipient, subject, body):
+        """
+        Adds the message to the current DB session, it's queued by the session's commit
+        """
+        message = OutboxMail(recipient=recipient, subject=subject, body=body)
+        db.session.add(message)
+        return message
+
+    def start(self):
+        """
+        Starts the worker, which is done as the app starts serving: mail queued or due to be retried
+        before a restart doesn't wait for new mail
+        """
+        self._worker.start()
+
+    def wake(self):
+        """
+        Makes the worker send the committed messages right away
+        """
+        self._worker.wake()
+
+    def deliver(self):
+        """
+        Sends the due messages, returns the number of sent ones
+        """
+        config = app.config['MAIL_OUTBOX']
+        sent = 0
+
+        with app.app_context():
+            try:
+                while True:
+                    batch = self._claim(config)
+                    if not batch:
+                        break
+
+                    sent += self._send(batch)
+
+                    if len(batch) < config['batch-size']:
+                        break
+            finally:
+                db.session.remove()
+
+        return sent
+
+    def _claim(self, config):
+        """
+        :return: [(id, recipient, subject, body)] of the due messages claimed by this worker
+        """
+        now = datetime.now()
+        batch = []
+
+        for message in OutboxMail.get_due(config['attempts'], config['batch-size']):
+            retry_at = now + timedelta(seconds=config['backoff'] * 2 ** message.attempts)
+            if OutboxMail.claim(message.id, message.attempts, retry_at):
+                batch.append((message.id, message.recipient, message.subject, message.body))
+
+        db.session.commit()
+
+        return batch
+
+    def _send(self, batch):
+        sent, errors = [], {}
+
+        try:
+            with mail.connect() as connection:
+                for mail_id, recipient, subject, body in batch:
+                    try:
+                        connection.send(Message(subject, recipients=[recipient], body=body))
+                        sent.append(mail_id)
+                    except Exception as e:
+                        print(f'Failed to send mail #{mail_id}: {e}', file=sys.stderr)
+                        errors[mail_id] = str(e)
+        except Exception as e:
+            # Connection failed: the rest of the batch is retried as scheduled
+            print(f'Failed to connect to the mail server: {e}', file=sys.stderr)
+            for mail_id, *_ in batch:
+                if mail_id not in sent:
+                    errors.setdefault(mail_id, str(e))
+
+        if sent:
+            OutboxMail.query.filter(OutboxMail.id.in_(sent)).delete(synchronize_session=False)
+        for mail_id, error in errors.items():
+            OutboxMail.query.filter(OutboxMail.id == mail_id).update({OutboxMail.error: error},
+                                                                     synchronize_session=False)
+        db.session.commit()
+
+        return len(sent)
+
+
+mail_outbox = MailOutbox()
+
+app.before_first_request(mail_outbox.start)
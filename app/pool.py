@@ -0,0 +1,70 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.exceptions import ServiceUnavailable
+
+from app import app
+
+
+class ProcessPool:
+    """
+    Process pool for CPU-bound request work, configured by `app.config[config_name]`.
+
+    At most `workers + queue-size` jobs are in flight, any job over it and any job not done in `timeout`
+    seconds fail fast with `unavailable` (a 503). Zero workers means running jobs in the calling thread.
+    """
+
+    def __init__(self, config_name, unavailable=ServiceUnavailable):
+        self.config_name = config_name
+        self.unavailable = unavailable
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = None
+
+    def run(self, fn, *args):
+        config = app.config[self.config_name]
+
+        if not config['workers']:
+            return fn(*args)
+
+        executor, slots = self._get_executor(config)
+
+        if not slots.acquire(blocking=False):
+            raise self.unavailable()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._reset(executor)
+            raise self.unavailable()
+
+        # The slot is held until the job is actually done, even if the request gave up waiting for it
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=config['timeout'])
+        except TimeoutError:
+            future.cancel()
+            raise self.unavailable()
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise self.unavailable()
+
+    def _get_executor(self, config):
+        with self._lock:
+            # A pool inherited from the parent process by a forked worker is unusable
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=config['workers'])
+                self._slots = threading.BoundedSemaphore(config['workers'] + config['queue-size'])
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
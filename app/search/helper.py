@@ -0,0 +1,46 @@
+import re
+
+from app.helper import clear_html_tags
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+CYRILLIC_PATTERN = re.compile(r'[а-я]')
+
+MIN_STEM_LENGTH = 3
+
+# Light stemming: the longest matching ending is stripped as long as the stem stays long enough
+RU_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ией', 'иях', 'иям', 'ием', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ой', 'ей', 'ий', 'ый', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев',
+    'ых', 'их', 'ую', 'юю', 'ию', 'ью', 'ия', 'ья', 'ии', 'ться', 'тся', 'ать', 'ять', 'ить', 'еть', 'ешь',
+    'ет', 'ут', 'ют', 'ит', 'ат', 'ят', 'ал', 'ил', 'ла', 'ли', 'ло',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+EN_ENDINGS = sorted((
+    'ingly', 'edly', 'ings', 'ing', 'ies', 'ied', 'ed', 'es', 'ly', 's',
+), key=len, reverse=True)
+
+
+def normalize(token):
+    return token.lower().replace('ё', 'е')
+
+
+def stem(token):
+    endings = RU_ENDINGS if CYRILLIC_PATTERN.search(token) else EN_ENDINGS
+
+    for ending in endings:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM_LENGTH:
+            return token[:-len(ending)]
+
+    return token
+
+
+def tokenize(text):
+    """
+    Splits plain text into normalized & stemmed terms, single characters are dropped
+    """
+    return [stem(token) for token in map(normalize, TOKEN_PATTERN.findall(text)) if len(token) > 1]
+
+
+def tokenize_html(html):
+    return tokenize(clear_html_tags(html))
@@ -0,0 +1,370 @@
+import bisect
+import gzip
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from app import app, db
+from app.api.cache import response_cache
+from app.models import Post
+from app.search.helper import tokenize, tokenize_html
+from app.worker import BackgroundWorker
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FORMAT_VERSION = 1
+
+
+class SearchIndex:
+    """
+    In-process inverted index of accepted active posts: term > {post id: weight}.
+
+    Title terms weigh `SEARCH['title-boost']` times more than text ones. Scheduled posts are indexed too
+    and filtered out by publication time at query time.
+
+    The index is persisted as a snapshot, gzipped JSON of per-post term weights, and a journal of per-post
+    changes appended to it. Saved posts are indexed by a background thread, which appends them to the journal,
+    folds the journal into a new snapshot once it's over `SEARCH['compact-size']` bytes and then invalidates
+    the cached post lists, search results among them. Writers hold an exclusive lock of the `.lock` file
+    & catch up with the journal first, readers hold a shared one (an exclusive one on Windows), so no worker
+    overwrites changes of another. Every worker reads the journal from where it stopped.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._docs = {}             # post id > (publication timestamp, {term: weight})
+        self._postings = {}         # term > {post id: weight}
+        self._vocabulary = []       # sorted terms for prefix lookups
+        self._snapshot = None       # (inode, mtime, size) of the loaded snapshot
+        self._offset = 0            # bytes of the journal applied
+        self._checked = 0
+        self._queue = queue.Queue()
+        # Queued posts are written on shutdown
+        self._worker = BackgroundWorker('search-index', self._write_queued, 'Failed to save search index',
+                                        on_exit=lambda: self.flush(5))
+
+    """
+    Search
+    """
+
+    def search(self, query):
+        """
+        Returns (sort key, post id) pairs of matching published posts in ascending order of sort keys, i.e.
+        by relevance, then by publication time & id (desc). Every query term has to match a post's term as a prefix.
+        """
+        terms = tokenize(query)
+
+        if not terms:
+            return []
+
+        self._ensure_fresh()
+
+        with self._lock:
+            total = len(self._docs) or 1
+            scores = None
+
+            for term in set(terms):
+                matches = Counter()
+                for indexed_term in self._prefixed(term):
+                    postings = self._postings[indexed_term]
+                    idf = math.log(1 + total / len(postings))
+                    for post_id, weight in postings.items():
+                        matches[post_id] += idf * (1 + math.log(weight))
+
+                scores = matches if scores is None else Counter(
+                    {post_id: score + matches[post_id] for post_id, score in scores.items() if post_id in matches})
+
+                if not scores:
+                    return []
+
+            now = datetime.now().timestamp()
+
+            return sorted(
+                ((-round(score, 6), -self._docs[post_id][0], -post_id), post_id)
+                for post_id, score in scores.items() if self._docs[post_id][0] <= now
+            )
+
+    def _prefixed(self, term):
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + '\uffff', lo=start)
+        return [indexed_term for indexed_term in self._vocabulary[start:end] if self._postings.get(indexed_term)]
+
+    """
+    Incremental updates
+    """
+
+    def update_post(self, post):
+        """
+        Queues the post to be (re)indexed if it's accepted & active, removed from the index otherwise
+        """
+        if post.is_active and post.moderation_status == 'ACCEPTED':
+            self._queue.put((post.id, post.time.timestamp(), post.title, post.text))
+        else:
+            self._queue.put((post.id, None, None, None))
+
+        self._worker.start()
+
+    def flush(self, timeout=None):
+        """
+        Waits for the queued posts to be written, returns False on timeout
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+        return True
+
+    @staticmethod
+    def weigh(title, text):
+        weights = Counter(tokenize_html(text))
+        boost = app.config['SEARCH']['title-boost']
+
+        for term in tokenize(title):
+            weights[term] += boost
+
+        return dict(weights)
+
+    def _write_queued(self):
+        posts = [self._queue.get()]
+        while True:
+            try:
+                posts.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            self._write(posts)
+            # Searches cached meanwhile might have been answered by the index without the posts
+            response_cache.invalidate('posts')
+        finally:
+            for _ in posts:
+                self._queue.task_done()
+
+    def _write(self, posts):
+        changes = b''.join(
+            json.dumps({'id': post_id, 'time': timestamp, 'weights': self.weigh(title, text)} if timestamp is not None
+                       else {'id': post_id}, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for post_id, timestamp, title, text in posts
+        )
+
+        with self._file_lock(exclusive=True):
+            if not self._refresh():
+                # No snapshot yet: it's built of the database, the posts are in there already
+                self._rebuild()
+                return
+
+            with open(self._journal_path(), 'ab') as f:
+                f.write(changes)
+
+            self._refresh()
+
+            if self._offset > app.config['SEARCH']['compact-size']:
+                self._save()
+
+    def _apply(self, change):
+        self._remove(change['id'])
+        if 'weights' in change:
+            self._add(change['id'], change['time'], change['weights'])
+
+    def _add(self, post_id, timestamp, weights):
+        self._docs[post_id] = (timestamp, weights)
+
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[post_id] = weight
+
+    def _remove(self, post_id):
+        doc = self._docs.pop(post_id, None)
+
+        if doc is None:
+            return
+
+        for term in doc[1]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(post_id, None)
+
+    """
+    Building & persistence
+    """
+
+    def rebuild(self, batch_size=200):
+        with self._file_lock(exclusive=True):
+            return self._rebuild(batch_size)
+
+    def _rebuild(self, batch_size=200):
+        with app.app_context(), self._lock:
+            self._docs, self._postings, self._vocabulary = {}, {}, []
+            last_id = 0
+
+            try:
+                while True:
+                    posts = Post.query.with_entities(Post.id, Post.title, Post.text, Post.time) \
+                        .filter(Post.id > last_id, Post.is_active, Post.moderation_status == 'ACCEPTED') \
+                        .order_by(Post.id) \
+                        .limit(batch_size) \
+                        .all()
+
+                    if not posts:
+                        break
+
+                    last_id = posts[-1].id
+
+                    for post in posts:
+                        self._add(post.id, post.time.timestamp(), self.weigh(post.title, post.text))
+            finally:
+                db.session.remove()
+
+            self._loaded = True
+            self._save()
+
+            return len(self._docs)
+
+    def _save(self):
+        """
+        Writes the snapshot of the index & starts the journal over, the exclusive lock is to be held
+        """
+        path = app.config['SEARCH']['index-path']
+        data = {
+            'version': INDEX_FORMAT_VERSION,
+            'docs': {post_id: [timestamp, weights] for post_id, (timestamp, weights) in self._docs.items()}
+        }
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, self._journal_path())
+
+        self._snapshot, self._offset = self._file_id(path), 0
+
+    def _load(self):
+        path = app.config['SEARCH']['index-path']
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index format version: {data.get('version')}.")
+
+        self._docs, self._postings, self._vocabulary = {}, {}, []
+        for post_id, (timestamp, weights) in data['docs'].items():
+            self._add(int(post_id), timestamp, weights)
+
+        self._snapshot, self._offset = self._file_id(path), 0
+        self._loaded = True
+
+    def _refresh(self):
+        """
+        Reloads the snapshot if another worker has written a new one & applies the rest of the journal,
+        the file lock is to be held.
+        :return: False if there's no snapshot to load
+        """
+        snapshot = self._file_id(app.config['SEARCH']['index-path'])
+
+        if snapshot is None:
+            return False
+
+        with self._lock:
+            if not self._loaded or snapshot != self._snapshot:
+                self._load()
+
+            try:
+                with open(self._journal_path(), 'rb') as f:
+                    f.seek(self._offset)
+                    for line in f:
+                        self._apply(json.loads(line))
+                        self._offset += len(line)
+            except FileNotFoundError:
+                pass
+
+        return True
+
+    def _ensure_fresh(self):
+        """
+        Loads (or builds) the index on first use and catches up with other workers' changes
+        every `SEARCH['reload-interval']` seconds
+        """
+        now = time.monotonic()
+
+        if self._loaded and now - self._checked < app.config['SEARCH']['reload-interval']:
+            return
+
+        self._checked = now
+
+        try:
+            with self._file_lock(exclusive=False):
+                if self._refresh():
+                    return
+        except (OSError, ValueError) as e:
+            print(f'Failed to load search index, rebuilding: {e}', file=sys.stderr)
+
+        with self._file_lock(exclusive=True):
+            # Could have been built by another worker meanwhile
+            try:
+                if self._refresh():
+                    return
+            except (OSError, ValueError):
+                pass
+            self._rebuild()
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        path = app.config['SEARCH']['index-path']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(f'{path}.lock', 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+                return
+
+            # Windows only has exclusive byte-range locks, `LK_LOCK` gives up after 10 attempts
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _journal_path():
+        return app.config['SEARCH']['index-path'] + '.journal'
+
+    @staticmethod
+    def _file_id(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+search_index = SearchIndex()
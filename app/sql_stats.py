@@ -0,0 +1,195 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+# Parts of a statement that differ between executions of the same query
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|:\w+|\?")
+PLACEHOLDER_LIST = re.compile(r'\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*')
+PLACEHOLDERS = re.compile(r'\?(?:, \?)+')
+WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement):
+    """
+    Normalized statement: literals & bound parameters replaced by `?`, lists of them (`IN (...)`,
+    multi-row `VALUES`) collapsed, so every execution of the same query has the same fingerprint
+    """
+    statement = LITERALS.sub('?', WHITESPACE.sub(' ', statement).strip())
+    statement = PLACEHOLDERS.sub('?', statement)
+    return PLACEHOLDER_LIST.sub('(?)', statement)
+
+
+class QueryStats:
+    """
+    Statements executed within a request: count, total & max time, time per fingerprint
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.fingerprints = {}
+
+    def add(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+        count, total, longest = self.fingerprints.get(statement, (0, 0.0, 0.0))
+        self.fingerprints[statement] = (count + 1, total + elapsed, max(longest, elapsed))
+
+    def header(self):
+        return f'count={self.count}; total={self.total * 1000:.2f}ms; max={self.max * 1000:.2f}ms'
+
+
+class SQLStats:
+    """
+    SQLAlchemy engine instrumentation, a lightweight replacement of `SQLALCHEMY_ECHO`. Every statement is timed
+    and accounted to the current request, which is reported in the `X-SQL-Stats` response header if
+    `SQL_STATS['header']` is on, and then to the request's endpoint: requests, statements, total & max time,
+    and the same per statement fingerprint. Statements of background threads are accounted to `thread:<name>`.
+
+    Statements slower than `SQL_STATS['slow-threshold']` are written to the slow query log, sampled by
+    `SQL_STATS['slow-sample-rate']`. Endpoint stats are per process and kept until restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow_log = None
+
+    def report(self, top=10):
+        """
+        :return: {endpoint: {requests, statements, time, max, fingerprints: [top fingerprints by time]}},
+                 times in ms
+        """
+        with self._lock:
+            endpoints = {name: (dict(stats), dict(stats['fingerprints'])) for name, stats in self._endpoints.items()}
+
+        report = {}
+
+        for name, (stats, fingerprints) in endpoints.items():
+            hottest = sorted(fingerprints.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            report[name] = {
+                'requests': stats['requests'],
+                'statements': stats['statements'],
+                'time': round(stats['time'] * 1000, 2),
+                'max': round(stats['max'] * 1000, 2),
+                'fingerprints': [
+                    {'statement': statement, 'count': count, 'time': round(total * 1000, 2),
+                     'max': round(longest * 1000, 2)}
+                    for statement, (count, total, longest) in hottest
+                ]
+            }
+
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    """
+    Engine & request hooks
+    """
+
+    def before_request(self):
+        g.sql_stats = QueryStats()
+
+    def after_request(self, response):
+        stats = g.pop('sql_stats', None)
+
+        if stats is not None:
+            self._account(request.endpoint or '<unknown>', stats, requests=1)
+            if app.config['SQL_STATS']['header']:
+                response.headers['X-SQL-Stats'] = stats.header()
+
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['sql_stats_start'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.pop('sql_stats_start')
+        config = app.config['SQL_STATS']
+
+        if not config['enabled']:
+            return
+
+        statement_fingerprint = fingerprint(statement)
+
+        if elapsed >= config['slow-threshold'] and random.random() < config['slow-sample-rate']:
+            self._log_slow(statement, parameters, elapsed)
+
+        stats = g.get('sql_stats') if has_request_context() else None
+
+        if stats is not None:
+            stats.add(statement_fingerprint, elapsed)
+        else:
+            stats = QueryStats()
+            stats.add(statement_fingerprint, elapsed)
+            self._account(f'thread:{threading.current_thread().name}', stats)
+
+    def _account(self, endpoint, stats, requests=0):
+        max_fingerprints = app.config['SQL_STATS']['max-fingerprints']
+
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, dict(requests=0, statements=0, time=0.0, max=0.0,
+                                                               fingerprints={}))
+            totals['requests'] += requests
+            totals['statements'] += stats.count
+            totals['time'] += stats.total
+            totals['max'] = max(totals['max'], stats.max)
+
+            fingerprints = totals['fingerprints']
+            for statement, (count, total, longest) in stats.fingerprints.items():
+                # Statements built with unbounded variety (e.g. dynamic column lists) shouldn't eat memory
+                if statement not in fingerprints and len(fingerprints) >= max_fingerprints:
+                    statement = '<other>'
+                old_count, old_total, old_longest = fingerprints.get(statement, (0, 0.0, 0.0))
+                fingerprints[statement] = (old_count + count, old_total + total, max(old_longest, longest))
+
+    def _log_slow(self, statement, parameters, elapsed):
+        if self._slow_log is None:
+            with self._lock:
+                if self._slow_log is None:
+                    self._slow_log = create_slow_log(app.config['SQL_STATS']['slow-log-path'])
+
+        endpoint = request.endpoint if has_request_context() else f'thread:{threading.current_thread().name}'
+        self._slow_log.warning('%.2fms %s %s %r', elapsed * 1000, endpoint,
+                               WHITESPACE.sub(' ', statement).strip(), parameters)
+
+
+def create_slow_log(path):
+    """
+    Logger writing to the file, to stderr if there's no path
+    """
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = logging.FileHandler(path, delay=True) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+
+    slow_log = logging.getLogger('app.sql_stats.slow')
+    slow_log.propagate = False
+    slow_log.setLevel(logging.WARNING)
+    slow_log.addHandler(handler)
+
+    return slow_log
+
+
+sql_stats = SQLStats()
+
+event.listen(Engine, 'before_cursor_execute', sql_stats.before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', sql_stats.after_cursor_execute)
+app.before_request(sql_stats.before_request)
+app.after_request(sql_stats.after_request)
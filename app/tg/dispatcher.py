@@ -0,0 +1,274 @@
+import queue
+import random
+import re
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app import app
+from app.worker import BackgroundWorker
+
+# Telegram's limit for a message text
+MAX_MESSAGE_LENGTH = 4096
+
+# MarkdownV2 tokens: escaped characters & entity delimiters
+MARKDOWN_TOKENS = re.compile(r'\\.|\|\||[*_`~\[)]', re.S)
+
+
+def truncate(message, limit=MAX_MESSAGE_LENGTH):
+    """
+    Cuts MarkdownV2 text to the limit without breaking an escape sequence or leaving an entity unclosed:
+    the text is cut before the earliest entity still open at the limit.
+    """
+    if len(message) <= limit:
+        return message
+
+    text = message[:limit - 1]
+    opened = {}
+
+    for match in MARKDOWN_TOKENS.finditer(text):
+        token = match.group(0)
+        if token.startswith('\\'):
+            continue
+        if token == ')':
+            opened.pop('[', None)
+        elif token in opened and token != '[':
+            del opened[token]
+        else:
+            opened.setdefault(token, match.start())
+
+    # A trailing backslash escapes nothing, the character it escaped is cut off
+    end = min(opened.values(), default=len(text))
+    text = text[:end]
+    if (len(text) - len(text.rstrip('\\'))) % 2:
+        text = text[:-1]
+
+    return text + '…'
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures: deliveries are suspended for `timeout` seconds,
+    then a single trial delivery closes it again or reopens it.
+    """
+
+    def __init__(self, threshold, timeout):
+        self.threshold = threshold
+        self.timeout = timeout
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self._opened_at < self.timeout else 'half-open'
+
+    def wait(self):
+        """
+        Blocks the delivering thread while the breaker is open
+        """
+        while self.state == 'open':
+            time.sleep(max(self._opened_at + self.timeout - time.monotonic(), 0))
+
+    def success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def failure(self):
+        self._failures += 1
+        if self._failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+
+class TelegramDispatcher:
+    """
+    Delivers notifications through the Telegram proxy in the background.
+
+    Messages are put into a bounded queue (ones over `TELEGRAM['queue-size']` are dropped) and sent by
+    `TELEGRAM['workers']` threads, each with its own keep-alive session. Messages arriving within
+    `TELEGRAM['digest-window']` seconds are joined into a single digest. Failed deliveries are retried with
+    exponential backoff, and consecutive failures open a circuit breaker instead of piling up slow requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._breaker = None
+        self._sessions = threading.local()
+        self._counters = dict(queued=0, dropped=0, delivered=0, failed=0, digests=0, retries=0)
+        # Give the queued notifications a chance to be delivered on shutdown
+        self._workers = BackgroundWorker('telegram', self._deliver_queued, 'Failed to deliver Telegram messages',
+                                         threads=lambda: app.config['TELEGRAM']['workers'],
+                                         on_start=self._prepare, on_exit=lambda: self.join(5))
+
+    def submit(self, message):
+        """
+        Queues the message, returns False if it's dropped because the queue is full
+        """
+        self._workers.start()
+
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._count('dropped')
+            print('Telegram queue is full, message dropped.', file=sys.stderr)
+            return False
+
+        self._count('queued')
+        return True
+
+    def join(self, timeout=None):
+        """
+        Waits for the queued messages to be processed, returns False on timeout
+        """
+        if self._queue is None:
+            return True
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+        return True
+
+    def metrics(self):
+        config = app.config['TELEGRAM']
+
+        with self._lock:
+            metrics = dict(self._counters)
+
+        metrics.update(
+            depth=self._queue.qsize() if self._queue is not None else 0,
+            capacity=config['queue-size'],
+            workers=len(self._workers.threads),
+            breaker=self._breaker.state if self._breaker is not None else 'closed'
+        )
+
+        return metrics
+
+    """
+    Delivery
+    """
+
+    def _prepare(self):
+        config = app.config['TELEGRAM']
+        self._breaker = CircuitBreaker(config['breaker-threshold'], config['breaker-timeout'])
+        self._queue = queue.Queue(maxsize=config['queue-size'])
+
+    def _deliver_queued(self):
+        batch = self._collect()
+
+        try:
+            for digest, size in self._digests(batch):
+                self._count('delivered' if self._deliver(self._session(), digest) else 'failed', size)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _session(self):
+        """
+        Keep-alive session of the worker thread
+        """
+        session = getattr(self._sessions, 'session', None)
+
+        if session is None:
+            session = self._sessions.session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=1))
+            session.mount('https://', HTTPAdapter(pool_maxsize=1))
+
+        return session
+
+    def _collect(self):
+        config = app.config['TELEGRAM']
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + config['digest-window']
+
+        while len(batch) < config['digest-size']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    @staticmethod
+    def _digests(messages):
+        """
+        Joins messages into as few texts within Telegram's message length as possible.
+        :return: (text, number of messages in it) pairs
+        """
+        digest, size = '', 0
+
+        for message in messages:
+            message = truncate(message)
+            if digest and len(digest) + 2 + len(message) > MAX_MESSAGE_LENGTH:
+                yield digest, size
+                digest, size = '', 0
+            digest = f'{digest}\n\n{message}' if digest else message
+            size += 1
+
+        if digest:
+            yield digest, size
+
+    def _deliver(self, session, text):
+        config = app.config['TELEGRAM']
+
+        for attempt in range(config['retries'] + 1):
+            if attempt:
+                self._count('retries')
+                time.sleep(config['backoff'] * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+            self._breaker.wait()
+            delivered, retryable = self._post(session, text, config)
+
+            if delivered:
+                self._breaker.success()
+                self._count('digests')
+                return True
+
+            if not retryable:
+                return False
+
+            self._breaker.failure()
+
+        return False
+
+    @staticmethod
+    def _post(session, text, config):
+        """
+        :return: (delivered, worth retrying)
+        """
+        try:
+            response = session.post(config['proxy-url'], timeout=config['timeout'],
+                                    json={'token': config['proxy-jwt-token'], 'message': text})
+        except requests.RequestException as e:
+            print(f'Telegram proxy request error: {e}', file=sys.stderr)
+            return False, True
+
+        if response.ok:
+            return True, False
+
+        try:
+            data = response.json()
+            print(f"{data.get('error')}: {data.get('message')}", file=sys.stderr)
+        except ValueError:
+            print(f'Telegram proxy error: HTTP {response.status_code}', file=sys.stderr)
+
+        # Client errors but throttling won't go away on retry
+        return False, response.status_code >= 500 or response.status_code == 429
+
+    def _count(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] += value
+
+
+dispatcher = TelegramDispatcher()
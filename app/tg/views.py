@@ -0,0 +1,21 @@
+from flask import Blueprint, abort, jsonify
+
+from app.api.auth.helper import auth_required
+from app.api.helper import error_response
+from app.tg.dispatcher import dispatcher
+
+telegram = Blueprint('telegram', __name__)
+
+
+@telegram.route('/api/telegram/metrics', methods=['GET'])
+@auth_required
+def metrics(user):
+    if not user.is_moderator:
+        abort(403, "You're not allowed to view notification metrics.")
+
+    return jsonify(dispatcher.metrics()), 200
+
+
+@telegram.errorhandler(Exception)
+def handle_error(e):
+    return error_response(e)
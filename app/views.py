@@ -1,23 +1,106 @@
-from flask import render_template, g, session, send_from_directory
+import mimetypes
+import os
+
+from flask import g, session, request, safe_join, send_file, Response, abort
 
 from app import app
+from app.assets import static_assets
+from app.api.image.storage import storage
 
 
 @app.before_request
 def before_request():
+    # Uploads, static assets & the SPA shell are public: not touching the session keeps them free
+    # of `Vary: Cookie` for shared caches
+    if request.endpoint in ('upload', 'index'):
+        g.user = None
+        return
+
     g.user = session['user'] if 'user' in session else None
 
 
+@app.after_request
+def after_request(response):
+    """
+    Conditional GET for JSON API: strong ETag of the content, unless already set from cheap validator inputs
+    (see `conditional`) or by the response cache, and 304 Not Modified if it matches `If-None-Match`
+    """
+    if request.method == 'GET' and response.status_code == 200 and response.is_json \
+            and not response.direct_passthrough:
+        response.add_etag()
+        response.make_conditional(request)
+
+    return response
+
+
+@app.route('/upload/<path:path>')
+def upload(path):
+    """
+    Serves uploaded files. Content-addressed ones never change, so they're cached for good & their ETag is
+    the storage key. With `UPLOADS['offload']` the worker only resolves the file and answers conditional
+    requests, the bytes (and ranges) are streamed by the front proxy.
+    """
+    config = app.config['UPLOADS']
+    path, vary = negotiate_upload(path)
+    full_path = safe_join(app.config['UPLOAD_DIR'], path)
+
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    match = storage.KEY_PATTERN.search('/' + path)
+
+    if config['offload']:
+        rv = Response(mimetype=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        if config['offload'] == 'x-accel-redirect':
+            rv.headers['X-Accel-Redirect'] = config['internal-prefix'] + path
+        else:
+            rv.headers['X-Sendfile'] = full_path
+    else:
+        rv = send_file(full_path, conditional=False, add_etags=False)
+
+    if match:
+        rv.set_etag(f'{match.group(3)}/{os.path.basename(path)}')
+        rv.cache_control.max_age = config['max-age']
+        rv.cache_control.immutable = True
+    else:
+        stat = os.stat(full_path)
+        rv.set_etag(f'{int(stat.st_mtime)}-{stat.st_size}')
+        rv.cache_control.max_age = config['legacy-max-age']
+
+    rv.cache_control.public = True
+
+    if vary:
+        rv.vary.add('Accept')
+
+    if config['offload']:
+        rv.make_conditional(request)
+        if rv.status_code == 304:
+            # Nothing to stream: the proxy must not follow the redirect
+            rv.headers.pop('X-Accel-Redirect', None)
+            rv.headers.pop('X-Sendfile', None)
+        return rv
+
+    return rv.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(full_path))
+
+
+def negotiate_upload(path):
+    """
+    Swaps the path for its WebP copy, if there's one, for browsers explicitly accepting WebP.
+    :return: (path, whether the response varies by `Accept`)
+    """
+    webp_path = os.path.splitext(path)[0] + '.webp'
+
+    if webp_path == path or not os.path.isfile(safe_join(app.config['UPLOAD_DIR'], webp_path) or ''):
+        return path, False
+
+    accepts_webp = any(value == 'image/webp' for value, _ in request.accept_mimetypes)
+
+    return (webp_path if accepts_webp else path), True
+
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def index(path):
-    url_parts = path.split('/')
-
-    if len(url_parts) > 0:
-        if url_parts[0] in ['favicon.ico', 'default-1.png', 'css', 'fonts', 'img', 'js']:
-            return send_from_directory(app.config['STATIC_RESOURCES_DIR'], path)
-
-        if url_parts[0] == 'upload':
-            return send_from_directory(app.config['APP_ROOT_DIR'], path)
+    rv = static_assets.response(path) if path else None
+    return rv if rv is not None else static_assets.shell_response()
 
-    return render_template("index.html")
@@ -0,0 +1,70 @@
+import atexit
+import sys
+import threading
+
+
+class BackgroundWorker:
+    """
+    Daemon thread(s) of a component running its `step` over and over: back to back if the step blocks on its own
+    (e.g. on a queue), otherwise every `interval` seconds or as soon as `wake()` is called.
+
+    Threads are started once, on first use or by `start()` when the app starts, after `on_start` has prepared
+    what they share. A failing step is printed to stderr after `error` and doesn't stop the thread. `on_exit`
+    (e.g. a flush of the pending work) is called on shutdown. `interval` & `threads` may be callables reading
+    the config when they're needed.
+    """
+
+    def __init__(self, name, step, error, interval=None, threads=1, on_start=None, on_exit=None):
+        self.name = name
+        self._step = step
+        self._error = error
+        self._interval = interval
+        self._threads = threads
+        self._on_start = on_start
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+        self.threads = []
+
+        if on_exit is not None:
+            atexit.register(on_exit)
+
+    @property
+    def started(self):
+        return self._started
+
+    def start(self):
+        if self._started:
+            return
+
+        with self._lock:
+            if self._started:
+                return
+
+            if self._on_start is not None:
+                self._on_start()
+
+            count = self._threads() if callable(self._threads) else self._threads
+            for i in range(count):
+                thread = threading.Thread(target=self._run, name=self.name if count == 1 else f'{self.name}-{i}',
+                                          daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+            self._started = True
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                print(f'{self._error}: {e}', file=sys.stderr)
+
+            interval = self._interval() if callable(self._interval) else self._interval
+            if interval is not None:
+                self._wake.wait(interval)
+                self._wake.clear()
@@ -23,7 +23,9 @@ CREATE TABLE IF NOT EXISTS `captcha_codes` (
   `code` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
   `secret_code` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
   `time` datetime(6) NOT NULL,
-  PRIMARY KEY (`id`)
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `idx_captcha_codes_secret_code` (`secret_code`),
+  KEY `idx_captcha_codes_time` (`time`)
 ) ENGINE=InnoDB AUTO_INCREMENT=73 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Дамп данных таблицы blogapp.captcha_codes: ~2 rows (приблизительно)
@@ -367,6 +369,29 @@ INSERT INTO `global_settings` (`id`, `code`, `name`, `value`) VALUES
 	(3, 'STATISTICS_IS_PUBLIC', 'Показывать всем статистику блога', 'YES');
 /*!40000 ALTER TABLE `global_settings` ENABLE KEYS */;
 
+-- Дамп структуры для таблица blogapp.mail_outbox
+DROP TABLE IF EXISTS `mail_outbox`;
+CREATE TABLE IF NOT EXISTS `mail_outbox` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `recipient` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `subject` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `body` text COLLATE utf8mb4_unicode_ci NOT NULL,
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `next_attempt` datetime(6) NOT NULL,
+  `error` text COLLATE utf8mb4_unicode_ci DEFAULT NULL,
+  `time` datetime(6) NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_mail_outbox_next_attempt` (`next_attempt`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Дамп структуры для таблица blogapp.post_calendar
+DROP TABLE IF EXISTS `post_calendar`;
+CREATE TABLE IF NOT EXISTS `post_calendar` (
+  `date` date NOT NULL,
+  `count` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Дамп структуры для таблица blogapp.posts
 DROP TABLE IF EXISTS `posts`;
 CREATE TABLE IF NOT EXISTS `posts` (
@@ -374,14 +399,20 @@ CREATE TABLE IF NOT EXISTS `posts` (
   `is_active` bit(1) NOT NULL,
   `moderation_status` varchar(10) COLLATE utf8mb4_unicode_ci NOT NULL,
   `text` text COLLATE utf8mb4_unicode_ci NOT NULL,
+  `announce` text COLLATE utf8mb4_unicode_ci DEFAULT NULL,
   `time` datetime(6) NOT NULL,
   `title` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
   `view_count` int(11) NOT NULL,
+  `like_count` int(11) NOT NULL DEFAULT 0,
+  `dislike_count` int(11) NOT NULL DEFAULT 0,
+  `comment_count` int(11) NOT NULL DEFAULT 0,
   `user_id` int(11) NOT NULL,
   `moderator_id` int(11) DEFAULT NULL,
   PRIMARY KEY (`id`),
   KEY `idx_posts_title` (`title`),
   KEY `idx_posts_active_status_date` (`is_active`,`moderation_status`,`time`,`id`),
+  KEY `idx_posts_active_status_comments` (`is_active`,`moderation_status`,`comment_count`,`time`),
+  KEY `idx_posts_active_status_likes` (`is_active`,`moderation_status`,`like_count`,`time`),
   KEY `fk_posts_author_id` (`user_id`),
   KEY `fk_posts_moderator_id` (`moderator_id`),
   CONSTRAINT `fk_posts_author_id` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
@@ -514,6 +545,18 @@ INSERT INTO `posts_tags` (`post_id`, `tag_id`) VALUES
 	(55, 16);
 /*!40000 ALTER TABLE `posts_tags` ENABLE KEYS */;
 
+-- Дамп структуры для таблица blogapp.statistics
+DROP TABLE IF EXISTS `statistics`;
+CREATE TABLE IF NOT EXISTS `statistics` (
+  `user_id` int(11) NOT NULL,
+  `posts_count` int(11) NOT NULL DEFAULT 0,
+  `likes_count` int(11) NOT NULL DEFAULT 0,
+  `dislikes_count` int(11) NOT NULL DEFAULT 0,
+  `views_count` int(11) NOT NULL DEFAULT 0,
+  `first_publication` datetime(6) DEFAULT NULL,
+  PRIMARY KEY (`user_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Дамп структуры для таблица blogapp.tags
 DROP TABLE IF EXISTS `tags`;
 CREATE TABLE IF NOT EXISTS `tags` (
@@ -549,6 +592,16 @@ INSERT INTO `tags` (`id`, `name`) VALUES
 	(2, 'технологии');
 /*!40000 ALTER TABLE `tags` ENABLE KEYS */;
 
+-- Дамп структуры для таблица blogapp.uploads
+DROP TABLE IF EXISTS `uploads`;
+CREATE TABLE IF NOT EXISTS `uploads` (
+  `hash` char(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `refs` int(11) NOT NULL DEFAULT 1,
+  `files` text COLLATE utf8mb4_unicode_ci NOT NULL,
+  `time` datetime(6) NOT NULL,
+  PRIMARY KEY (`hash`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 -- Дамп структуры для таблица blogapp.users
 DROP TABLE IF EXISTS `users`;
 CREATE TABLE IF NOT EXISTS `users` (
@@ -687,6 +740,16 @@ INSERT INTO `votes` (`id`, `time`, `value`, `post_id`, `user_id`) VALUES
 	(327, '2020-02-20 16:54:08.000000', 1, 11, 18);
 /*!40000 ALTER TABLE `votes` ENABLE KEYS */;
 
+-- Пересчет денормализованных счетчиков постов (см. `flask recount-post-counters`)
+UPDATE `posts` p SET
+	p.`like_count` = (SELECT COUNT(*) FROM `votes` v WHERE v.`post_id` = p.`id` AND v.`value` = 1),
+	p.`dislike_count` = (SELECT COUNT(*) FROM `votes` v WHERE v.`post_id` = p.`id` AND v.`value` = -1),
+	p.`comment_count` = (SELECT COUNT(*) FROM `comments` c WHERE c.`post_id` = p.`id`);
+
+-- Заполнение календаря публикаций (см. `flask rebuild-post-calendar`)
+INSERT INTO `post_calendar` (`date`, `count`)
+	SELECT DATE(`time`), COUNT(*) FROM `posts` WHERE `is_active` = 1 AND `moderation_status` = 'ACCEPTED' GROUP BY DATE(`time`);
+
 /*!40101 SET SQL_MODE=IFNULL(@OLD_SQL_MODE, '') */;
 /*!40014 SET FOREIGN_KEY_CHECKS=IF(@OLD_FOREIGN_KEY_CHECKS IS NULL, 1, @OLD_FOREIGN_KEY_CHECKS) */;
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
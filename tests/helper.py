@@ -0,0 +1,31 @@
+"""
+Throwaway environment of the tests: the app is configured for a temporary SQLite database & directories
+before it's imported, so test modules import it from here.
+"""
+import os
+import tempfile
+
+TMP_DIR = tempfile.mkdtemp(prefix='blogapp-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'blogapp.db')}"
+os.environ['UPLOAD_DIR'] = os.path.join(TMP_DIR, 'upload')
+os.environ['SEARCH_INDEX_PATH'] = os.path.join(TMP_DIR, 'search-index.json.gz')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+from sqlalchemy import UniqueConstraint  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import Settings  # noqa: E402
+
+
+def create_schema():
+    """
+    Creates the tables missing in the test database
+    """
+    # The dump only has a unique key on the settings code
+    table = Settings.__table__
+    for column in (table.c.name, table.c.value):
+        column.unique = False
+    table.constraints = {constraint for constraint in table.constraints
+                         if not isinstance(constraint, UniqueConstraint)}
+
+    db.create_all()
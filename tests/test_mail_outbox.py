@@ -0,0 +1,157 @@
+"""
+Mail outbox delivers the queued mail in the background through a local SMTP stand-in, retries failed attempts
+and doesn't wait for new mail to send the queued one.
+
+Runs against a throwaway SQLite database: python -m unittest discover tests
+"""
+import email
+import socketserver
+import threading
+import time
+import unittest
+
+# Configures the app for the tests, so it goes first
+from helper import app, db, create_schema
+from app.models import User, OutboxMail
+from app.outbox import mail_outbox
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    The part of SMTP the mail client needs: no extensions, any command but the ones below is accepted
+    """
+
+    def handle(self):
+        self.reply('220 localhost SMTP stand-in')
+        recipients = []
+
+        for line in iter(self.rfile.readline, b''):
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('451 Try again later' if self.server.refusing else '250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append((recipients, email.message_from_bytes(data)))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Local SMTP server keeping the received messages: [(recipients, message)]. Senders are refused with
+    a temporary error while `refusing` is set.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.refusing = False
+
+
+class MailOutboxTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = app.config['MAIL_OUTBOX']
+        app.config['MAIL_OUTBOX'] = dict(cls.config, backoff=0.1, **{'poll-interval': 0.1})
+        app.config['PASSWORD_HASHING'] = dict(app.config['PASSWORD_HASHING'], workers=0)
+
+        cls.smtp = SMTPStandIn()
+        threading.Thread(target=cls.smtp.serve_forever, daemon=True).start()
+
+        mail = app.extensions['mail']
+        mail.server, mail.port = '127.0.0.1', cls.smtp.server_address[1]
+        mail.use_tls = mail.use_ssl = False
+        mail.username = mail.password = None
+        mail.default_sender = 'noreply@blog.tld'
+        mail.suppress = False
+        mail.debug = 0
+
+        create_schema()
+        db.session.add(User(email='reader@blog.tld', name='Reader', password='secret3'))
+        db.session.commit()
+        db.session.remove()
+
+    @classmethod
+    def tearDownClass(cls):
+        app.config['MAIL_OUTBOX'] = cls.config
+        cls.smtp.shutdown()
+        cls.smtp.server_close()
+
+    def setUp(self):
+        self.smtp.messages.clear()
+        self.smtp.refusing = False
+
+    @staticmethod
+    def wait_for(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            try:
+                if condition():
+                    return True
+            finally:
+                db.session.remove()
+            time.sleep(0.05)
+
+        return False
+
+    def queue_mail(self, subject):
+        mail_outbox.put('reader@blog.tld', subject, 'Body')
+        db.session.commit()
+        db.session.remove()
+
+    def test_restore_mail(self):
+        rv = app.test_client().post('/api/auth/restore', json={'email': 'reader@blog.tld'})
+        self.assertEqual(rv.status_code, 200, rv.data)
+
+        self.assertTrue(self.wait_for(lambda: self.smtp.messages), 'The mail is not sent.')
+        recipients, message = self.smtp.messages[0]
+        self.assertEqual(recipients, ['reader@blog.tld'])
+        self.assertIn(f"/login/change-password/{User.get_by_email('reader@blog.tld').code}",
+                      message.get_payload(decode=True).decode())
+
+        self.assertTrue(self.wait_for(lambda: OutboxMail.query.count() == 0), 'The sent mail is left in the outbox.')
+
+    def test_queued_mail_is_sent_without_wake(self):
+        # Serving starts the worker, like after a restart with mail left in the outbox
+        app.test_client().get('/api/init')
+        self.queue_mail('Queued before')
+
+        self.assertTrue(self.wait_for(lambda: self.smtp.messages), 'The queued mail is not sent.')
+        self.assertEqual(self.smtp.messages[0][1]['Subject'], 'Queued before')
+
+    def test_failed_mail_is_retried(self):
+        self.smtp.refusing = True
+        app.test_client().get('/api/init')
+        self.queue_mail('Retried')
+
+        self.assertTrue(self.wait_for(lambda: OutboxMail.query.filter(OutboxMail.error.isnot(None)).count()),
+                        'The failed attempt is not recorded.')
+        self.assertEqual(self.smtp.messages, [])
+
+        self.smtp.refusing = False
+
+        self.assertTrue(self.wait_for(lambda: self.smtp.messages), 'The failed mail is not retried.')
+        self.assertTrue(self.wait_for(lambda: OutboxMail.query.count() == 0), 'The sent mail is left in the outbox.')
+
+
+if __name__ == '__main__':
+    unittest.main()
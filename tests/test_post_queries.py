@@ -0,0 +1,156 @@
+"""
+Statement counts of the post API endpoints don't depend on the page size or the number of comments.
+
+Runs against a throwaway SQLite database: python -m unittest discover tests
+"""
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+# Configures the app for the tests, so it goes first
+from helper import app, db, create_schema
+from app.api.post.counts import post_counts
+from app.models import User, Post, Comment, Tag, Settings
+
+PAGE_SIZES = (5, 20)
+
+
+class PostQueriesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['RESPONSE_CACHE'] = dict(app.config['RESPONSE_CACHE'], enabled=False)
+        app.config['PASSWORD_HASHING'] = dict(app.config['PASSWORD_HASHING'], workers=0)
+        app.config['TELEGRAM'] = dict(app.config['TELEGRAM'], enabled=None)
+
+        create_schema()
+
+        for code in ('MULTIUSER_MODE', 'POST_PREMODERATION', 'STATISTICS_IS_PUBLIC'):
+            db.session.add(Settings(code=code, name=code, value='YES'))
+
+        moderator = User(email='moderator@blog.tld', name='Moderator', password='secret1', is_moderator=True)
+        author = User(email='author@blog.tld', name='Author', password='secret2')
+        tags = [Tag('python'), Tag('flask')]
+        db.session.add_all([moderator, author, *tags])
+        db.session.flush()
+
+        published = datetime.now() - timedelta(days=3)
+
+        for i in range(2 * max(PAGE_SIZES)):
+            # Every other post isn't backfilled with an announce
+            post = Post(title=f'Post number {i}', text=f'<p>Some <b>text</b> of post {i}</p>', is_active=True,
+                        announce=None if i % 2 else f'Some text of post {i}', moderation_status='ACCEPTED',
+                        time=published - timedelta(hours=i), user_id=author.id, tags=tags)
+            new_post = Post(title=f'New post {i}', text=f'<p>Text of new post {i}</p>', is_active=True,
+                            announce=None if i % 2 else f'Text of new post {i}', moderation_status='NEW',
+                            time=published - timedelta(hours=i), user_id=author.id)
+            db.session.add_all([post, new_post])
+
+        db.session.flush()
+
+        # Published & pending posts with a few and many comments
+        cls.posts, cls.new_posts = {}, {}
+        for posts, status in ((cls.posts, 'ACCEPTED'), (cls.new_posts, 'NEW')):
+            for comment_count in (2, 10):
+                post = Post.query.filter(Post.comment_count == 0, Post.moderation_status == status).first()
+                for i in range(comment_count):
+                    db.session.add(Comment(text=f'Comment {i}', post_id=post.id, user_id=moderator.id))
+                post.comment_count = comment_count
+                posts[comment_count] = post.id
+
+        db.session.commit()
+        db.session.remove()
+
+        cls.moderator = cls.login('moderator@blog.tld', 'secret1')
+        cls.author = cls.login('author@blog.tld', 'secret2')
+
+    @staticmethod
+    def login(email, password):
+        client = app.test_client()
+        rv = client.post('/api/auth/login', json={'e_mail': email, 'password': password})
+        assert rv.status_code == 200, rv.data
+        return client
+
+    def count_statements(self, client, method, url, **kwargs):
+        """
+        Statements executed by the request itself, i.e. in this thread: background writers are not counted
+        """
+        statements = []
+        thread = threading.get_ident()
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if threading.get_ident() == thread:
+                statements.append(statement)
+
+        post_counts.invalidate()
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            rv = client.open(url, method=method, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+            db.session.remove()
+
+        self.assertLess(rv.status_code, 400, rv.data)
+        return len(statements)
+
+    def assertConstantStatements(self, client, method, urls, **kwargs):
+        # Warm up the per-process caches (settings, etc.) first
+        client.open(urls[0], method=method, **kwargs)
+
+        counts = {url: self.count_statements(client, method, url, **kwargs) for url in urls}
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_list_posts(self):
+        for mode in ('recent', 'popular', 'best', 'early'):
+            with self.subTest(mode=mode):
+                self.assertConstantStatements(self.author, 'GET', [
+                    f'/api/post?offset=0&limit={limit}&mode={mode}' for limit in PAGE_SIZES])
+                self.assertConstantStatements(self.author, 'GET', [
+                    f'/api/post?cursor=&limit={limit}&mode={mode}' for limit in PAGE_SIZES])
+
+    def test_filtered_posts(self):
+        date = (datetime.now() - timedelta(days=3)).strftime('%Y-%m-%d')
+
+        for request_type, query in (('byTag', 'tag=python'), ('byDate', f'date={date}'), ('search', 'query=text')):
+            with self.subTest(request_type=request_type):
+                self.assertConstantStatements(self.author, 'GET', [
+                    f'/api/post/{request_type}?offset=0&limit={limit}&{query}' for limit in PAGE_SIZES])
+
+    def test_my_posts(self):
+        self.assertConstantStatements(self.author, 'GET', [
+            f'/api/post/my?offset=0&limit={limit}&status=published' for limit in PAGE_SIZES])
+
+    def test_moderated_posts(self):
+        self.assertConstantStatements(self.moderator, 'GET', [
+            f'/api/post/moderation?offset=0&limit={limit}&status=new' for limit in PAGE_SIZES])
+
+    def test_full_post(self):
+        self.assertConstantStatements(self.author, 'GET', [
+            f'/api/post/{post_id}' for post_id in self.posts.values()])
+
+    def test_vote_post(self):
+        counts = [self.count_statements(self.moderator, 'POST', '/api/post/like', json={'post_id': post_id})
+                  for post_id in self.posts.values()]
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_add_post(self):
+        data = dict(time='2020-01-01T10:00', active=1, text='<p>Text of the added post</p>', tags=['python'])
+        counts = [self.count_statements(self.author, 'POST', '/api/post', json=dict(data, title=f'Added post {i}'))
+                  for i in range(3)]
+        # The first one loads the search index
+        self.assertEqual(len(set(counts[1:])), 1, counts)
+
+    def test_edit_post(self):
+        # Pending ones: editing a published post by its author sends it back to moderation, i.e. shifts
+        # the calendar rollup by a MySQL upsert
+        data = dict(time='2020-01-01T10:00', active=1, title='Edited post', tags=['python', 'flask'])
+        counts = [self.count_statements(self.author, 'PUT', f'/api/post/{post_id}',
+                                        json=dict(data, text=f'<p>Edited text of post {post_id}</p>'))
+                  for post_id in self.new_posts.values()]
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+if __name__ == '__main__':
+    unittest.main()